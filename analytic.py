@@ -0,0 +1,144 @@
+"""
+analytic.py - Closed-form wastage for the deterministic (single talker) scenarios.
+With one active party nothing is random, and the run has at most two phases:
+an end party walks inwards until it reaches the middle's buffer and swaps into
+the middle of the larger side, and a middle party expands alternately until
+both gaps shrink to d. Each phase's length follows from the start positions.
+Outside the validated regime (d < 3, or n too small for a swap to fit) the
+functions return None and callers fall back to run_simulation.
+
+Run: python analytic.py --n 1000000000 --d 1000 [--check]
+"""
+import argparse
+import time
+
+# Below this, a middle party's gaps can still trigger a second swap
+MIN_D = 3
+
+
+def single_party_wasted(n, d, party):
+    """
+    Pads left unused when only 'party' ('A', 'B' or 'C') sends until blocked,
+    from the initial A-C-B state. Returns None where the closed form does not apply.
+    """
+    if d < MIN_D:
+        return None
+    m = n // 2  # C's start (the middle boundary)
+
+    if party == 'C':
+        # Middle from the start: expands between 0 and n+1 until both gaps are d
+        if m <= d:
+            return None
+        return 2 * d
+
+    if party == 'A':
+        # Walks 1..m-d-1; the last pad triggers the swap if the right side fits 2d
+        end_used = m - d - 1
+        if end_used < 1:
+            return None
+        if n - m < 2 * d:
+            return n - end_used
+        # Middle of (m, n+1) from (m + n + 1) // 2, stopping d short of both sides
+        start = (m + n + 1) // 2
+        if start - m <= d or n - start < d:
+            return None
+        return n - end_used - (n - m - 2 * d)
+
+    if party == 'B':
+        # Walks n..m+d+1; swaps into the middle of (0, m) if that side fits 2d
+        end_used = n - m - d
+        if end_used < 1:
+            return None
+        if m <= 2 * d:
+            return n - end_used
+        start = m // 2
+        if start <= d or m - start - 1 < d:
+            return None
+        return n - end_used - (m - 1 - 2 * d)
+
+    raise ValueError(f"Unknown party '{party}'")
+
+
+def single_party_wastage(n, d, party):
+    """Wastage % for one talker (as run_simulation returns it), or None if not covered."""
+    wasted = single_party_wasted(n, d, party)
+    if wasted is None:
+        return None
+    return (wasted / n) * 100.0
+
+
+def scenario_wastage(n, d, candidates):
+    """
+    Expected wastage % of a scenario column whose runs draw uniformly from 'candidates',
+    or None unless every candidate is a single talker covered by the closed form.
+    """
+    values = []
+    for subset in candidates:
+        if len(subset) != 1:
+            return None
+        value = single_party_wastage(n, d, subset[0])
+        if value is None:
+            return None
+        values.append(value)
+    return sum(values) / len(values)
+
+
+def validate(max_n, d_values=None):
+    """
+    Compares the closed form with run_simulation for every n <= max_n (and d in d_values,
+    default all d < n). Returns: (cases compared, list of (n, d, party, closed form, simulated)).
+    """
+    from suite import run_simulation
+    compared = 0
+    mismatches = []
+    for n in range(1, max_n + 1):
+        for d in (d_values if d_values is not None else range(n)):
+            for party in 'ABC':
+                expected = single_party_wastage(n, d, party)
+                if expected is None:
+                    continue
+                simulated = run_simulation(n, d, [party])
+                compared += 1
+                if simulated != expected:
+                    mismatches.append((n, d, party, expected, simulated))
+    return compared, mismatches
+
+
+def main():
+    from suite import SCENARIOS, run_simulation
+    parser = argparse.ArgumentParser(description="Closed-form wastage for single-talker scenarios")
+    parser.add_argument('--n', type=int, default=1000)
+    parser.add_argument('--d', type=int, default=10)
+    parser.add_argument('--check', action='store_true', help="also run run_simulation for comparison")
+    parser.add_argument('--validate', type=int, default=0, metavar='MAX_N',
+                        help="compare against run_simulation for all n <= MAX_N and d < n")
+    args = parser.parse_args()
+
+    if args.validate:
+        start = time.perf_counter()
+        compared, mismatches = validate(args.validate)
+        print(f"Validated {compared} (n, d, party) cases up to n={args.validate} "
+              f"in {time.perf_counter() - start:.1f}s: {len(mismatches)} mismatches")
+        for case in mismatches[:20]:
+            print(f"  n={case[0]} d={case[1]} party={case[2]}: closed form {case[3]}, simulated {case[4]}")
+        if mismatches:
+            raise SystemExit(1)
+        return
+
+    print(f"Closed-form wastage: n={args.n}, d={args.d}")
+    for name, candidates in SCENARIOS:
+        value = scenario_wastage(args.n, args.d, candidates)
+        if value is None:
+            print(f"  {name:<9}: not covered (random schedule)" if any(len(s) > 1 for s in candidates)
+                  else f"  {name:<9}: outside the closed-form regime")
+            continue
+        line = f"  {name:<9}: {value:.4f}%"
+        if args.check:
+            start = time.perf_counter()
+            simulated = sum(run_simulation(args.n, args.d, s) for s in candidates) / len(candidates)
+            line += f"  (run_simulation {simulated:.4f}% in {time.perf_counter() - start:.3f}s)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+batch.py - Vectorized NumPy engine running M protocol instances in lockstep.
+Mirrors ThreePartyProtocol (protocol.py) with one array row per instance.
+Requires numpy (only imported when this backend is selected).
+"""
+import numpy as np
+
+PARTIES = ['A', 'B', 'C']
+
+
+class BatchProtocol:
+    """
+    State of M independent ThreePartyProtocol instances.
+    Parties are column indices (A=0, B=1, C=2); roles hold a party index per row.
+    """
+    def __init__(self, n, d, m):
+        self.n = n
+        self.d = d
+        self.m = m
+        self.rows = np.arange(m)
+
+        self.last_used = np.tile(np.array([0, n + 1, n // 2], dtype=np.int64), (m, 1))
+        self.has_sent = np.zeros((m, 3), dtype=bool)
+        self.messages_sent = np.zeros((m, 3), dtype=np.int64)
+
+        self.left_party = np.full(m, 0, dtype=np.int64)
+        self.middle_party = np.full(m, 2, dtype=np.int64)
+        self.right_party = np.full(m, 1, dtype=np.int64)
+
+        # Boundaries of the current middle party (one pair per instance)
+        self.middle_left_boundary = np.full(m, n // 2, dtype=np.int64)
+        self.middle_right_boundary = np.full(m, n // 2, dtype=np.int64)
+
+        # Pads 0..n+1 so virtual positions index safely
+        self.used_pads = np.zeros((m, n + 2), dtype=bool)
+        self.used_count = np.zeros(m, dtype=np.int64)
+
+    def _role_pos(self, role):
+        return self.last_used[self.rows, role]
+
+    def get_next_positions(self):
+        """Next candidate position for every (instance, party): shape (M, 3)."""
+        lb = self.middle_left_boundary
+        rb = self.middle_right_boundary
+        left_pos = self._role_pos(self.left_party)
+        right_pos = self._role_pos(self.right_party)
+
+        # Middle: single free spot, else move towards the largest gap (ties go right)
+        spot_free = (lb == rb) & ~self.used_pads[self.rows, lb]
+        left_gap = lb - left_pos - 1
+        right_gap = right_pos - rb - 1
+        mid_next = np.where(spot_free, lb, np.where(left_gap > right_gap, lb - 1, rb + 1))
+
+        nxt = np.empty((self.m, 3), dtype=np.int64)
+        for p in range(3):
+            cur = self.last_used[:, p]
+            nxt[:, p] = np.where(self.middle_party == p, mid_next,
+                                 np.where(self.left_party == p, cur + 1, cur - 1))
+        return nxt
+
+    def check_safety(self, nxt):
+        """Vectorized check_safety for the (M, 3) candidate positions."""
+        d = self.d
+        lb = self.middle_left_boundary[:, None]
+        rb = self.middle_right_boundary[:, None]
+        left_pos = self._role_pos(self.left_party)[:, None]
+        right_pos = self._role_pos(self.right_party)[:, None]
+        cols = np.arange(3)[None, :]
+
+        in_range = (nxt >= 1) & (nxt <= self.n)
+        clipped = np.clip(nxt, 0, self.n + 1)
+        unused = ~self.used_pads[self.rows[:, None], clipped]
+
+        # Each party is checked against the two roles it does not hold
+        is_mid = self.middle_party[:, None] == cols
+        is_left = self.left_party[:, None] == cols
+        is_right = self.right_party[:, None] == cols
+        near_mid = (np.abs(nxt - lb) <= d) | (np.abs(nxt - rb) <= d)
+        near_left = np.abs(nxt - left_pos) <= d
+        near_right = np.abs(nxt - right_pos) <= d
+        blocked = (~is_mid & near_mid) | (~is_left & near_left) | (~is_right & near_right)
+        return in_range & unused & ~blocked
+
+    def send(self, mask, party, nxt):
+        """Commit one send of `party` (per row) for the rows selected by mask."""
+        rows = self.rows[mask]
+        party = party[mask]
+        pos = nxt[rows, party]
+
+        self.last_used[rows, party] = pos
+        self.has_sent[rows, party] = True
+        self.used_pads[rows, pos] = True
+        self.used_count[rows] += 1
+        self.messages_sent[rows, party] += 1
+
+        is_mid = self.middle_party[rows] == party
+        self.middle_left_boundary[rows] = np.where(
+            is_mid, np.minimum(self.middle_left_boundary[rows], pos), self.middle_left_boundary[rows])
+        self.middle_right_boundary[rows] = np.where(
+            is_mid, np.maximum(self.middle_right_boundary[rows], pos), self.middle_right_boundary[rows])
+
+        self.reposition_if_needed(mask)
+
+    def reposition_if_needed(self, mask):
+        """Vectorized reposition_if_needed; at most one swap per row."""
+        d = self.d
+        rows = self.rows
+        left_pos = self._role_pos(self.left_party)
+        right_pos = self._role_pos(self.right_party)
+        lb = self.middle_left_boundary.copy()
+        rb = self.middle_right_boundary.copy()
+        threshold = d + 1
+
+        # Left <-> Middle Trigger
+        swap_left = mask & (np.abs(lb - left_pos) <= threshold) & (right_pos - rb > d * 2)
+        # Middle <-> Right Trigger (only if the first did not fire)
+        swap_right = mask & ~swap_left & (np.abs(right_pos - rb) <= threshold) & (lb - left_pos > d * 2)
+
+        if swap_left.any():
+            r = rows[swap_left]
+            old_left = self.left_party[r]
+            old_middle = self.middle_party[r]
+            new_pos = (rb[r] + right_pos[r]) // 2
+            # Ghost Pad: resume from RIGHT boundary
+            self.last_used[r, old_middle] = rb[r]
+            self.left_party[r] = old_middle
+            self.middle_party[r] = old_left
+            self.last_used[r, old_left] = new_pos
+            self.has_sent[r, old_left] = True
+            self.middle_left_boundary[r] = new_pos
+            self.middle_right_boundary[r] = new_pos
+
+        if swap_right.any():
+            r = rows[swap_right]
+            old_right = self.right_party[r]
+            old_middle = self.middle_party[r]
+            new_pos = (left_pos[r] + lb[r]) // 2
+            # Ghost Pad: resume from LEFT boundary
+            self.last_used[r, old_middle] = lb[r]
+            self.right_party[r] = old_middle
+            self.middle_party[r] = old_right
+            self.last_used[r, old_right] = new_pos
+            self.has_sent[r, old_right] = True
+            self.middle_left_boundary[r] = new_pos
+            self.middle_right_boundary[r] = new_pos
+
+
+def run_batch_simulation(n, d, active_masks, rng):
+    """
+    Batched suite.run_simulation: row i only lets parties with active_masks[i] talk.
+    active_masks: (M, 3) bool array over (A, B, C). Returns (M,) % wastage.
+    """
+    active = np.asarray(active_masks, dtype=bool)
+    m = active.shape[0]
+    batch = BatchProtocol(n, d, m)
+
+    # Randomize "Personality" (Weights) for the ACTIVE subset
+    weights = rng.random((m, 3)) * active
+    cum_weights = np.cumsum(weights, axis=1)
+    cum_weights /= cum_weights[:, -1:]
+
+    running = np.ones(m, dtype=bool)
+    while running.any():
+        nxt = batch.get_next_positions()
+        ok = batch.check_safety(nxt) & active
+
+        # Pick one party per row by weight
+        u = rng.random(m)[:, None]
+        choice = np.minimum((u >= cum_weights).sum(axis=1), 2)
+        chosen_ok = ok[batch.rows, choice]
+
+        # If blocked, force a uniform move from another active party that can send
+        others = ok.sum(axis=1)
+        deadlock = running & ~chosen_ok & (others == 0)
+        running &= ~deadlock
+
+        pick = np.floor(rng.random(m) * np.maximum(others, 1)).astype(np.int64)
+        alt = np.argmax(np.cumsum(ok, axis=1) > pick[:, None], axis=1)
+        party = np.where(chosen_ok, choice, alt)
+
+        batch.send(running, party, nxt)
+        running &= batch.used_count < n
+
+    return (n - batch.used_count) / n * 100.0
+
+
+def masks_for(subsets):
+    """List of active party lists (e.g. [['A'], ['B', 'C']]) -> (M, 3) bool mask."""
+    mask = np.zeros((len(subsets), 3), dtype=bool)
+    for i, subset in enumerate(subsets):
+        for party in subset:
+            mask[i, PARTIES.index(party)] = True
+    return mask
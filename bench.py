@@ -0,0 +1,285 @@
+"""
+bench.py - Benchmarks for the protocol hot paths.
+Micro: per-call cost of the protocol methods and send call patterns, k-party scaling,
+padstore.py throughput. Macro: run_simulation per TEST_CONFIGS entry and a server
+/run round trip over a local socket.
+--json writes the results; --compare checks them against such a file and exits 1
+on any regression beyond --threshold.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from kparty import KPartyProtocol
+from ledger import SetLedger
+from padstore import CONSUMED_SUFFIX, PadStore, create_pad_file, np
+from protocol import ThreePartyProtocol
+from server import ProtocolHandler, ProtocolServer
+from suite import TEST_CONFIGS, run_simulation
+
+SECTIONS = ['send', 'micro', 'kparty', 'padstore', 'simulation', 'server']
+
+# Units where a larger value is better; everything else is a cost
+HIGHER_IS_BETTER = {'MB/s'}
+
+
+def make_schedule(length, seed):
+    rng = random.Random(seed)
+    return [rng.choice('ABC') for _ in range(length)]
+
+
+def time_pattern(n, d, schedule, pattern, repeat, ledger=None):
+    """Best-of-'repeat' nanoseconds per scheduled message for one call pattern (default ledger unless given)."""
+    best = None
+    for _ in range(repeat):
+        protocol = ThreePartyProtocol(n, d) if ledger is None else ThreePartyProtocol(n, d, ledger=ledger)
+        start = time.perf_counter_ns()
+        if pattern == 'can_send+send_message':
+            for party in schedule:
+                if protocol.can_send(party):
+                    protocol.send_message(party)
+        elif pattern == 'send_message':
+            for party in schedule:
+                protocol.send_message(party)
+        else:
+            for party in schedule:
+                protocol.try_send(party)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(schedule)
+
+
+def time_calls(func, calls, repeat):
+    """Best-of-'repeat' nanoseconds per func(*args) over the argument tuples in 'calls' (loop included)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for call_args in calls:
+            func(*call_args)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(calls)
+
+
+def time_methods(n, d, schedule, repeat):
+    """
+    ns/call of the read-only protocol methods on a state half-way through 'schedule'.
+    reposition_if_needed is timed on its common no-swap path.
+    """
+    protocol = ThreePartyProtocol(n, d)
+    for party in schedule[:len(schedule) // 2]:
+        protocol.try_send(party)
+    positions = {p: protocol.get_next_position(p) for p in protocol.parties}
+    return {
+        'get_next_position': time_calls(protocol.get_next_position, [(p,) for p in schedule], repeat),
+        'check_safety': time_calls(protocol.check_safety, [(p, positions[p]) for p in schedule], repeat),
+        'reposition_if_needed': time_calls(protocol.reposition_if_needed, [()] * len(schedule), repeat),
+    }
+
+
+def time_simulation(n, d, runs, seed, repeat):
+    """Best-of-'repeat' mean milliseconds per run_simulation with all three parties talking (S.3)."""
+    best = None
+    for _ in range(repeat):
+        rng = random.Random(seed)
+        start = time.perf_counter_ns()
+        for _ in range(runs):
+            run_simulation(n, d, ['A', 'B', 'C'], rng)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / runs / 1e6
+
+
+class QuietHandler(ProtocolHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def time_server(batch, requests):
+    """Mean milliseconds per /run round trip (3 * batch steps) on a keep-alive local connection."""
+    httpd = ProtocolServer(('127.0.0.1', 0), QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1])
+
+    def post(path, body):
+        conn.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        return json.loads(conn.getresponse().read())
+
+    try:
+        session = post('/init', {'n': 3 * batch * (requests + 1) * 2, 'd': 10})['session']
+        run = {'session': session, 'a': batch, 'b': batch, 'c': batch}
+        post('/run', run)  # Warm-up
+        start = time.perf_counter_ns()
+        for _ in range(requests):
+            post('/run', run)
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        conn.close()
+        httpd.shutdown()
+        httpd.server_close()
+    return elapsed / requests / 1e6
+
+
+def time_kparty(n, d, k, length, seed, repeat):
+    """Best-of-'repeat' nanoseconds per try_send for k parties picked uniformly."""
+    rng = random.Random(seed)
+    schedule = [rng.randrange(k) for _ in range(length)]
+    best = None
+    for _ in range(repeat):
+        protocol = KPartyProtocol(n, d, k)
+        start = time.perf_counter_ns()
+        for party in schedule:
+            protocol.try_send(party)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / length, protocol.jumps
+
+
+def time_padstore(pad_size, pads, backend, bulk, repeat):
+    """
+    Best-of-'repeat' MB/s encrypting through padstore.py (XOR + zeroize + marking).
+    bulk: one message over all pads, else one pad-sized message per pad.
+    """
+    message = os.urandom(pads * pad_size if bulk else pad_size)
+    best = None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pads.bin')
+        for _ in range(repeat):
+            create_pad_file(path, pads, pad_size)
+            if os.path.exists(path + CONSUMED_SUFFIX):
+                os.remove(path + CONSUMED_SUFFIX)  # Fresh pads: drop the previous repeat's journal
+            with PadStore(path, pad_size, backend) as store:
+                start = time.perf_counter_ns()
+                if bulk:
+                    store.xor(1, message)
+                else:
+                    for index in range(1, pads + 1):
+                        store.xor(index, message)
+                elapsed = time.perf_counter_ns() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return pads * pad_size / (best / 1e9) / 1e6
+
+
+def compare(results, baseline, threshold):
+    """Prints every metric against the baseline. Returns the names that got worse by more than 'threshold'."""
+    regressions = []
+    print(f"Comparison against baseline (threshold {threshold:.0%}):")
+    for name, entry in results.items():
+        old = baseline.get(name)
+        if old is None or old['unit'] != entry['unit'] or not old['value']:
+            print(f"  {name:<40} {entry['value']:12.2f} {entry['unit']:<10} (no baseline)")
+            continue
+        change = entry['value'] / old['value'] - 1
+        worse = -change if entry['unit'] in HIGHER_IS_BETTER else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"  {name:<40} {old['value']:12.2f} -> {entry['value']:12.2f} {entry['unit']:<10} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Protocol benchmarks")
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--d', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sections', default=','.join(SECTIONS), help=f"comma-separated subset of {','.join(SECTIONS)}")
+    parser.add_argument('--k', default='3,5,10,20,50', help="party counts for the k-party scaling run")
+    parser.add_argument('--pad-size', type=int, default=4096, help="bytes per pad for the padstore run")
+    parser.add_argument('--pad-mb', type=int, default=64, help="pad file size for the padstore run")
+    parser.add_argument('--runs', type=int, default=20, help="run_simulation calls per TEST_CONFIGS entry")
+    parser.add_argument('--requests', type=int, default=200, help="/run round trips for the server run")
+    parser.add_argument('--json', help="write results to this file (e.g. a new baseline)")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed slowdown before failing --compare")
+    args = parser.parse_args()
+
+    sections = args.sections.split(',')
+    for section in sections:
+        if section not in SECTIONS:
+            parser.error(f"unknown section '{section}'")
+    results = {}
+
+    def record(name, value, unit):
+        results[name] = {'value': value, 'unit': unit}
+
+    schedule = make_schedule(args.messages, args.seed)
+    if 'send' in sections:
+        print(f"Send path microbenchmark: n={args.n}, d={args.d}, messages={args.messages}")
+        for pattern in ('can_send+send_message', 'send_message', 'try_send'):
+            ns = time_pattern(args.n, args.d, schedule, pattern, args.repeat)
+            record(f"send/{pattern}", ns, 'ns/message')
+            print(f"  {pattern:<24} {ns:8.0f} ns/message")
+        # The set ledger is the pre-interval baseline the default ledger must not fall behind
+        for pattern in ('can_send+send_message', 'try_send'):
+            ns = time_pattern(args.n, args.d, schedule, pattern, args.repeat, SetLedger)
+            record(f"send/{pattern}[set]", ns, 'ns/message')
+            print(f"  {pattern + '[set]':<24} {ns:8.0f} ns/message")
+        ratio = results['send/can_send+send_message']['value'] / results['send/try_send']['value']
+        print(f"  try_send speedup: {ratio:.2f}x")
+        ratio = results['send/try_send']['value'] / results['send/try_send[set]']['value']
+        print(f"  interval vs set ledger (try_send): {ratio:.2f}x")
+
+    if 'micro' in sections:
+        print(f"Protocol methods (mid-run state): n={args.n}, d={args.d}")
+        for name, ns in time_methods(args.n, args.d, schedule, args.repeat).items():
+            record(f"micro/{name}", ns, 'ns/call')
+            print(f"  {name:<24} {ns:8.0f} ns/call")
+
+    if 'kparty' in sections:
+        print(f"k-party scaling (KPartyProtocol.try_send): n={args.n}, d={args.d}, messages={args.messages}")
+        for k in [int(x) for x in args.k.split(',')]:
+            if k * (args.d + 1) > args.n:
+                print(f"  k={k:<4} skipped (k * (d + 1) > n)")
+                continue
+            ns, jumps = time_kparty(args.n, args.d, k, args.messages, args.seed, args.repeat)
+            record(f"kparty/k={k}", ns, 'ns/message')
+            print(f"  k={k:<4} {ns:8.0f} ns/message  ({jumps} jumps)")
+
+    if 'padstore' in sections:
+        pads = args.pad_mb * 1024 * 1024 // args.pad_size
+        print(f"Pad store throughput (XOR + zeroize): pad size={args.pad_size} B, {args.pad_mb} MB")
+        for backend in (['numpy'] if np is not None else []) + ['int']:
+            for bulk in (False, True):
+                rate = time_padstore(args.pad_size, pads, backend, bulk, args.repeat)
+                mode = 'one message' if bulk else 'per pad'
+                record(f"padstore/{backend}/{mode.replace(' ', '_')}", rate, 'MB/s')
+                print(f"  {backend:<6} {mode:<12} {rate:8.0f} MB/s")
+
+    if 'simulation' in sections:
+        print(f"run_simulation (S.3, all parties), {args.runs} runs per config:")
+        for config in TEST_CONFIGS:
+            ms = time_simulation(config['n'], config['d'], args.runs, args.seed, args.repeat)
+            record(f"simulation/n={config['n']},d={config['d']}", ms, 'ms/run')
+            print(f"  n={config['n']:<5} d={config['d']:<4} {ms:8.3f} ms/run")
+
+    if 'server' in sections:
+        ms = time_server(10, args.requests)
+        record("server/run_round_trip", ms, 'ms/request')
+        print(f"Server /run round trip (30 steps, local socket): {ms:.3f} ms/request")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+codec.py - Compact columnar encoding of /run traces.
+Layout (little-endian): header | pads (uint32 x count) | parties | flags | role perms (uint8 x count)
+Header: magic b'OTPT', version (u8), 3 reserved bytes, count (u32) - 12 bytes, keeps pads 4-aligned.
+"""
+import struct
+import sys
+from array import array
+from itertools import permutations
+
+MAGIC = b'OTPT'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xI')
+
+PARTIES = ['A', 'B', 'C']
+PARTY_CODES = {p: i for i, p in enumerate(PARTIES)}
+
+# (left, middle, right) role assignments; index = perm id. index.html mirrors this order.
+ROLE_PERMS = [''.join(p) for p in permutations('ABC')]
+PERM_CODES = {p: i for i, p in enumerate(ROLE_PERMS)}
+
+FLAG_SUCCESS = 1
+FLAG_SWAP = 2
+
+
+def encode_trace(steps):
+    """Step records (as produced by server.iter_steps) -> packed bytes. 'state' is not kept."""
+    pads = array('I')
+    parties = bytearray()
+    flags = bytearray()
+    perms = bytearray()
+    for step in steps:
+        pads.append(step['pad'] or 0)
+        parties.append(PARTY_CODES[step['party']])
+        flags.append((FLAG_SUCCESS if step['success'] else 0) | (FLAG_SWAP if step.get('swap') else 0))
+        perms.append(PERM_CODES[step['left_p'] + step['mid_p'] + step['right_p']])
+
+    if sys.byteorder != 'little':
+        pads.byteswap()
+    return b''.join([HEADER.pack(MAGIC, VERSION, len(parties)), pads.tobytes(), parties, flags, perms])
+
+
+def decode_trace(data):
+    """Packed bytes -> list of step records (without 'state')."""
+    magic, version, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a packed trace")
+
+    offset = HEADER.size
+    pads = array('I')
+    pads.frombytes(data[offset:offset + 4 * count])
+    if sys.byteorder != 'little':
+        pads.byteswap()
+    offset += 4 * count
+    parties = data[offset:offset + count]
+    flags = data[offset + count:offset + 2 * count]
+    perms = data[offset + 2 * count:offset + 3 * count]
+
+    steps = []
+    for i in range(count):
+        roles = ROLE_PERMS[perms[i]]
+        success = bool(flags[i] & FLAG_SUCCESS)
+        steps.append({
+            'party': PARTIES[parties[i]],
+            'success': success,
+            'pad': pads[i] if success else None,
+            'left_p': roles[0],
+            'mid_p': roles[1],
+            'right_p': roles[2],
+            'swap': bool(flags[i] & FLAG_SWAP),
+        })
+    return steps
@@ -0,0 +1,188 @@
+"""
+kparty.py - k-party generalization of the OTP protocol.
+Parties own contiguous blocks of pads kept in position order (doubly-linked list).
+Each party grows its block towards the side with more room, keeping d pads away
+from every other block; a boxed-in party jumps to the midpoint of the largest
+free gap (its old block stays behind as a dead entry).
+Safety is a neighbour check, the largest gap a lazily validated max-heap:
+O(1) per ordinary send, O(log k) amortized per jump.
+"""
+import heapq
+from ledger import IntervalLedger
+
+
+class Block:
+    """Pads [lo, hi] of one party; party is None once abandoned (dead) or for the sentinels."""
+    __slots__ = ('lo', 'hi', 'party', 'fresh', 'prev', 'next', 'removed')
+
+    def __init__(self, lo, hi, party, fresh=False):
+        self.lo = lo
+        self.hi = hi
+        self.party = party
+        self.fresh = fresh  # Start spot not consumed yet (first send takes lo itself)
+        self.prev = None
+        self.next = None
+        self.removed = False
+
+
+class KPartyProtocol:
+    def __init__(self, n, d, k, ledger=IntervalLedger):
+        if k < 2: raise ValueError("k must be at least 2")
+        if n < k: raise ValueError("Need at least one pad per party (n >= k)")
+        self.n = n
+        self.d = d
+        self.k = k
+        self.parties = list(range(k))
+
+        # Sentinels just outside 1..n; parties start evenly spread, ends at 1 and n
+        self.head = Block(0, 0, None)
+        self.tail = Block(n + 1, n + 1, None)
+        self.head.next = self.tail
+        self.tail.prev = self.head
+        self.block = {}
+        for party in self.parties:
+            pos = 1 + party * (n - 1) // (k - 1)
+            self.block[party] = self._insert_after(self.tail.prev, Block(pos, pos, party, fresh=True))
+
+        # Max-heap of (-free pads, seq, left block). Gaps only shrink between pushes,
+        # so stale entries are fixed up when they reach the top.
+        self._gaps = []
+        self._seq = 0
+        block = self.head
+        while block is not self.tail:
+            self._push_gap(block)
+            block = block.next
+
+        self.used_pads = ledger(n)
+        self.messages_sent = {p: 0 for p in self.parties}
+        self.jumps = 0
+
+    def _insert_after(self, left, block):
+        block.prev = left
+        block.next = left.next
+        left.next.prev = block
+        left.next = block
+        return block
+
+    def _push_gap(self, left):
+        free = left.next.lo - left.hi - 1
+        if free > 0:
+            self._seq += 1
+            heapq.heappush(self._gaps, (-free, self._seq, left))
+
+    def _largest_gap(self):
+        # Left block of the largest free gap, or None if no pad is free between blocks
+        gaps = self._gaps
+        while gaps:
+            stored, _, left = gaps[0]
+            if not left.removed:
+                free = left.next.lo - left.hi - 1
+                if free == -stored:
+                    return left
+            heapq.heappop(gaps)
+            if not left.removed:
+                self._push_gap(left)
+        return None
+
+    def _buffer(self, block):
+        # Pads kept clear next to 'block'. Dead blocks keep it too: a live party
+        # may sit right behind one. Only the ends of 1..n need none.
+        return 0 if block is self.head or block is self.tail else self.d
+
+    def _room(self, block):
+        # Pads 'block' may still claim on (left, right)
+        prev, nxt = block.prev, block.next
+        left = block.lo - prev.hi - 1 - self._buffer(prev)
+        right = nxt.lo - block.hi - 1 - self._buffer(nxt)
+        return left, right
+
+    def get_next_position(self, party):
+        """Next pad of party's block, or None if it is boxed in."""
+        block = self.block[party]
+        left, right = self._room(block)
+        if block.fresh:
+            return block.lo if left >= 0 and right >= 0 else None
+        # Towards the side with more room, ties go right
+        if right >= left:
+            return block.hi + 1 if right > 0 else None
+        return block.lo - 1 if left > 0 else None
+
+    def _jump_target(self):
+        # (left block, midpoint) of the largest gap if the midpoint is clear of both sides
+        left = self._largest_gap()
+        if left is None: return None
+        right = left.next
+        mid = (left.hi + right.lo) // 2
+        if mid - left.hi <= self._buffer(left): return None
+        if right.lo - mid <= self._buffer(right): return None
+        return left, mid
+
+    def can_send(self, party):
+        return self.get_next_position(party) is not None or self._jump_target() is not None
+
+    def try_send(self, party):
+        """
+        Sends one message from 'party', jumping to the largest gap if boxed in.
+        Returns: the pad used, or None if blocked.
+        """
+        pos = self.get_next_position(party)
+        if pos is None:
+            pos = self._jump(party)
+            if pos is None: return None
+
+        block = self.block[party]
+        if block.fresh:
+            block.fresh = False
+        elif pos > block.hi:
+            block.hi = pos
+        else:
+            block.lo = pos
+        self.used_pads.add(pos)
+        self.messages_sent[party] += 1
+        return pos
+
+    def send_message(self, party):
+        return self.try_send(party)
+
+    def _jump(self, party):
+        target = self._jump_target()
+        if target is None: return None
+        left, mid = target
+
+        old = self.block[party]
+        if old.fresh:
+            # Never used: drop the entry, its neighbours' gaps merge
+            old.removed = True
+            old.prev.next = old.next
+            old.next.prev = old.prev
+            self._push_gap(old.prev)
+            if left is old:
+                left = old.prev
+        else:
+            old.party = None
+
+        block = self._insert_after(left, Block(mid, mid, party, fresh=True))
+        self.block[party] = block
+        self._push_gap(left)
+        self._push_gap(block)
+        self.jumps += 1
+        return mid
+
+    def windows(self):
+        """(lo, hi, party) per entry in position order; party None for dead blocks."""
+        result = []
+        block = self.head.next
+        while block is not self.tail:
+            result.append((block.lo, block.hi, block.party))
+            block = block.next
+        return result
+
+    def get_stats(self):
+        return {
+            'total': self.n,
+            'used': len(self.used_pads),
+            'wasted': self.n - len(self.used_pads),
+            'efficiency': ((self.n - len(self.used_pads))/self.n)*100 if self.n else 0,
+            'sent': self.messages_sent,
+            'jumps': self.jumps
+        }
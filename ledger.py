@@ -0,0 +1,152 @@
+"""
+Pad Ledgers - record which pads of 1..n have been consumed.
+IntervalLedger is the default backend used by protocol.py.
+SetLedger keeps the original one-int-per-pad set for reference/equivalence runs.
+"""
+import sys
+from bisect import bisect_right
+
+
+class IntervalLedger:
+    """
+    Consumed pads as sorted, disjoint, non-adjacent inclusive intervals.
+    Every role consumes contiguous runs, so k (intervals) stays tiny
+    while the pad count grows to N.
+    """
+    def __init__(self, n):
+        self.n = n
+        self._starts = []
+        self._ends = []
+        self._count = 0
+
+    def _find(self, pos):
+        # Index of the last interval starting at or before pos (-1 if none)
+        return bisect_right(self._starts, pos) - 1
+
+    def __contains__(self, pos):
+        i = bisect_right(self._starts, pos) - 1
+        return i >= 0 and pos <= self._ends[i]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for lo, hi in zip(self._starts, self._ends):
+            yield from range(lo, hi + 1)
+
+    def add(self, pos):
+        # Hot path (one pad per message): a pad almost always extends an interval
+        # by one, so bump that bound in place and merge only when two intervals meet
+        starts, ends = self._starts, self._ends
+        i = bisect_right(starts, pos) - 1
+        if i >= 0 and pos <= ends[i]:
+            return
+        joins_left = i >= 0 and ends[i] == pos - 1
+        joins_right = i + 1 < len(starts) and starts[i + 1] == pos + 1
+        if joins_left and joins_right:
+            ends[i] = ends[i + 1]
+            del starts[i + 1]
+            del ends[i + 1]
+        elif joins_left:
+            ends[i] = pos
+        elif joins_right:
+            starts[i + 1] = pos
+        else:
+            starts.insert(i + 1, pos)
+            ends.insert(i + 1, pos)
+        self._count += 1
+
+    def add_range(self, lo, hi):
+        if lo > hi: return
+        starts, ends = self._starts, self._ends
+
+        # First interval that touches or follows [lo, hi] (adjacency merges)
+        i = self._find(lo - 1)
+        if i < 0 or ends[i] < lo - 1:
+            i += 1
+
+        # Absorb every interval overlapping/adjacent to [lo, hi]
+        j = i
+        covered = 0
+        new_lo, new_hi = lo, hi
+        while j < len(starts) and starts[j] <= hi + 1:
+            covered += max(0, min(ends[j], hi) - max(starts[j], lo) + 1)
+            new_lo = min(new_lo, starts[j])
+            new_hi = max(new_hi, ends[j])
+            j += 1
+
+        self._count += (hi - lo + 1) - covered
+        starts[i:j] = [new_lo]
+        ends[i:j] = [new_hi]
+
+    def free_gap(self, pos):
+        """Maximal free run [lo, hi] containing pos, or None if pos is used."""
+        if pos < 1 or pos > self.n: return None
+        i = self._find(pos)
+        if i >= 0 and pos <= self._ends[i]: return None
+        lo = self._ends[i] + 1 if i >= 0 else 1
+        hi = self._starts[i + 1] - 1 if i + 1 < len(self._starts) else self.n
+        return (lo, hi)
+
+    def intervals(self):
+        return list(zip(self._starts, self._ends))
+
+    def copy(self):
+        other = IntervalLedger(self.n)
+        other._starts = self._starts[:]
+        other._ends = self._ends[:]
+        other._count = self._count
+        return other
+
+    def memory_bytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self._starts) + sys.getsizeof(self._ends)
+        size += sum(sys.getsizeof(v) for v in self._starts)
+        size += sum(sys.getsizeof(v) for v in self._ends)
+        return size
+
+
+class SetLedger:
+    """Original behavior: one set entry per consumed pad."""
+    def __init__(self, n):
+        self.n = n
+        self._pads = set()
+
+    def __contains__(self, pos):
+        return pos in self._pads
+
+    def __len__(self):
+        return len(self._pads)
+
+    def __iter__(self):
+        return iter(sorted(self._pads))
+
+    def add(self, pos):
+        self._pads.add(pos)
+
+    def add_range(self, lo, hi):
+        self._pads.update(range(lo, hi + 1))
+
+    def free_gap(self, pos):
+        if pos < 1 or pos > self.n or pos in self._pads: return None
+        lo = pos
+        while lo > 1 and (lo - 1) not in self._pads: lo -= 1
+        hi = pos
+        while hi < self.n and (hi + 1) not in self._pads: hi += 1
+        return (lo, hi)
+
+    def intervals(self):
+        result = []
+        for pos in sorted(self._pads):
+            if result and result[-1][1] == pos - 1:
+                result[-1] = (result[-1][0], pos)
+            else:
+                result.append((pos, pos))
+        return result
+
+    def copy(self):
+        other = SetLedger(self.n)
+        other._pads = set(self._pads)
+        return other
+
+    def memory_bytes(self):
+        return sys.getsizeof(self) + sys.getsizeof(self._pads) + sum(sys.getsizeof(v) for v in self._pads)
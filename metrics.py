@@ -0,0 +1,114 @@
+"""
+metrics.py - Optional instrumentation for ThreePartyProtocol and server.py.
+A protocol built with metrics=None pays one attribute check per send/block;
+per-method timing wraps the instance's methods only when enabled.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+BLOCK_REASONS = ('out_of_range', 'reused', 'buffer_left', 'buffer_middle', 'buffer_right')
+TIMED_METHODS = ('get_next_position', 'check_safety', 'reposition_if_needed', 'try_send', 'apply_send', 'send_many')
+
+# Request latency buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ProtocolMetrics:
+    """Counters (sends, swaps, blocks per reason) and, with timing=True, calls/ns per method."""
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.sends = 0
+        self.swaps = 0
+        self.blocks = dict.fromkeys(BLOCK_REASONS, 0)
+        self.calls = {name: [0, 0] for name in TIMED_METHODS} if timing else {}  # name -> [calls, ns]
+
+    def instrument(self, protocol):
+        # Shadow the protocol's methods with timed wrappers (internal calls go through them too)
+        for name in TIMED_METHODS:
+            setattr(protocol, name, self._timed(self.calls[name], getattr(protocol, name)))
+
+    @staticmethod
+    def _timed(totals, func):
+        clock = time.perf_counter_ns
+
+        def wrapper(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                totals[0] += 1
+                totals[1] += clock() - start
+        return wrapper
+
+    def merge(self, other):
+        self.sends += other.sends
+        self.swaps += other.swaps
+        for reason, count in other.blocks.items():
+            self.blocks[reason] += count
+        for name, (calls, ns) in other.calls.items():
+            totals = self.calls.setdefault(name, [0, 0])
+            totals[0] += calls
+            totals[1] += ns
+
+    def as_dict(self):
+        return {
+            'sends': self.sends,
+            'swaps': self.swaps,
+            'blocks': dict(self.blocks),
+            'calls': {name: {'calls': c, 'seconds': ns / 1e9} for name, (c, ns) in self.calls.items()},
+        }
+
+
+class Histogram:
+    """Thread-safe cumulative-bucket histogram (Prometheus style)."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels=''):
+        """Prometheus text lines for this histogram; labels like 'path="/run"'."""
+        sep = ',' if labels else ''
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + ('+Inf',), counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}" if labels else f"{name}_sum {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}" if labels else f"{name}_count {count}")
+        return lines
+
+
+def render_protocol(metrics, prefix='otp'):
+    """Prometheus text lines for (aggregated) ProtocolMetrics."""
+    lines = [
+        f"# HELP {prefix}_sends_total Pads consumed by sends.",
+        f"# TYPE {prefix}_sends_total counter",
+        f"{prefix}_sends_total {metrics.sends}",
+        f"# HELP {prefix}_swaps_total Role swaps performed by reposition_if_needed.",
+        f"# TYPE {prefix}_swaps_total counter",
+        f"{prefix}_swaps_total {metrics.swaps}",
+        f"# HELP {prefix}_blocks_total Blocked send attempts by reason.",
+        f"# TYPE {prefix}_blocks_total counter",
+    ]
+    lines += [f'{prefix}_blocks_total{{reason="{r}"}} {c}' for r, c in metrics.blocks.items()]
+    if metrics.calls:
+        lines += [f"# HELP {prefix}_method_calls_total Instrumented protocol method calls.",
+                  f"# TYPE {prefix}_method_calls_total counter"]
+        lines += [f'{prefix}_method_calls_total{{method="{m}"}} {c}' for m, (c, _) in metrics.calls.items()]
+        lines += [f"# HELP {prefix}_method_seconds_total Time spent in protocol methods (inclusive).",
+                  f"# TYPE {prefix}_method_seconds_total counter"]
+        lines += [f'{prefix}_method_seconds_total{{method="{m}"}} {ns / 1e9}' for m, (_, ns) in metrics.calls.items()]
+    return lines
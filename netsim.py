@@ -0,0 +1,211 @@
+"""
+netsim.py - Discrete-event simulation of the protocol over a network with latency.
+Every party decides on its own ThreePartyProtocol replica; its sends reach the other
+replicas only when delivered, so check_safety works from a stale view. A global
+ledger checks that no pad is ever consumed twice.
+
+Run: python netsim.py --n 100000 --d 50 --latency exp:2 --rate 1
+"""
+import argparse
+import heapq
+import random
+import time
+from ledger import IntervalLedger
+from protocol import ThreePartyProtocol
+
+PARTIES = ['A', 'B', 'C']
+
+# Event kinds
+SEND = 0
+DELIVER = 1
+
+
+def parse_latency(spec):
+    """'const:x', 'exp:mean' or 'uniform:lo:hi' -> function(rng) returning a delay."""
+    kind, *params = spec.split(':')
+    params = [float(p) for p in params]
+    if kind == 'const' and len(params) == 1:
+        value = params[0]
+        return lambda rng: value
+    if kind == 'exp' and len(params) == 1:
+        rate = 1.0 / params[0]
+        return lambda rng: rng.expovariate(rate)
+    if kind == 'uniform' and len(params) == 2:
+        lo, hi = params
+        return lambda rng: rng.uniform(lo, hi)
+    raise ValueError(f"Unknown latency '{spec}' (use const:x, exp:mean or uniform:lo:hi)")
+
+
+class NetworkSimulation:
+    """
+    Parties attempt sends as Poisson processes ('rates': party -> sends per time unit).
+    Each send is delivered to both peers after a 'latency' delay; links are FIFO.
+    A party holding 'window' messages not yet delivered to every peer waits
+    (window = d is the protocol's in-flight assumption).
+    Memory is bounded: the queue holds at most one attempt per party plus
+    the undelivered messages, and no trace is kept.
+    """
+    def __init__(self, n, d, latency, rates, window=None, rng=random):
+        self.n = n
+        self.d = d
+        self.latency = latency
+        self.rates = rates
+        self.window = d if window is None else window
+        self.rng = rng
+
+        self.replicas = {p: ThreePartyProtocol(n, d) for p in PARTIES}
+        self.consumed = IntervalLedger(n)  # Ground truth across all parties
+        self.undelivered = {(src, dst): 0 for src in PARTIES for dst in PARTIES if src != dst}
+        self.link_clock = dict.fromkeys(self.undelivered, 0.0)  # Last delivery time per link (FIFO)
+        self.queue = []
+        self.seq = 0
+        self.now = 0.0
+
+        self.events = 0
+        self.max_queue = 0
+        self.sent = {p: 0 for p in PARTIES}
+        self.blocked = {p: 0 for p in PARTIES}
+        self.window_blocked = {p: 0 for p in PARTIES}
+        self.reuses = 0
+        self.first_reuse = None
+
+    def _schedule(self, at, kind, party, payload=None):
+        self.seq += 1
+        heapq.heappush(self.queue, (at, self.seq, kind, party, payload))
+
+    def _in_flight(self, party):
+        return max(self.undelivered[(party, q)] for q in PARTIES if q != party)
+
+    def _deadlocked(self):
+        # Nothing in flight and no active party can move in its own view
+        if any(self.undelivered.values()):
+            return False
+        return not any(self.replicas[p].can_send(p) for p in PARTIES if self.rates.get(p))
+
+    def _on_send(self, party):
+        # Returns a stop reason, or None to keep going
+        rng = self.rng
+        self._schedule(self.now + rng.expovariate(self.rates[party]), SEND, party)
+
+        if self._in_flight(party) >= self.window:
+            self.window_blocked[party] += 1
+            return None
+
+        pad = self.replicas[party].try_send(party)
+        if pad is None:
+            self.blocked[party] += 1
+            return 'deadlock' if self._deadlocked() else None
+
+        self.sent[party] += 1
+        if pad in self.consumed:
+            self.reuses += 1
+            if self.first_reuse is None:
+                self.first_reuse = {'time': self.now, 'party': party, 'pad': pad}
+        else:
+            self.consumed.add(pad)
+
+        for q in PARTIES:
+            if q == party:
+                continue
+            link = (party, q)
+            at = max(self.now + self.latency(rng), self.link_clock[link])
+            self.link_clock[link] = at
+            self.undelivered[link] += 1
+            self._schedule(at, DELIVER, q, (party, pad))
+
+        if len(self.consumed) == self.n:
+            return 'exhausted'
+        return None
+
+    def run(self, max_events=None, max_time=None):
+        """Runs until pads run out, all active parties deadlock, or a limit is hit."""
+        for party in PARTIES:
+            if self.rates.get(party):
+                self._schedule(self.rng.expovariate(self.rates[party]), SEND, party)
+
+        replicas = self.replicas
+        undelivered = self.undelivered
+        queue = self.queue
+        reason = 'idle'
+        start = time.perf_counter()
+        while queue:
+            if len(queue) > self.max_queue:
+                self.max_queue = len(queue)
+            at, _, kind, party, payload = heapq.heappop(queue)
+            if max_time is not None and at > max_time:
+                reason = 'time'
+                break
+            self.now = at
+            self.events += 1
+
+            if kind == DELIVER:
+                src, pad = payload
+                replicas[party].apply_send(src, pad)
+                undelivered[(src, party)] -= 1
+            else:
+                stop = self._on_send(party)
+                if stop:
+                    reason = stop
+                    break
+
+            if max_events is not None and self.events >= max_events:
+                reason = 'events'
+                break
+        wall = time.perf_counter() - start
+
+        views = {''.join([r.left_party, r.middle_party, r.right_party]) for r in replicas.values()}
+        return {
+            'reason': reason,
+            'events': self.events,
+            'sim_time': self.now,
+            'wall_time': wall,
+            'events_per_sec': self.events / wall if wall else 0.0,
+            'max_queue': self.max_queue,
+            'sent': dict(self.sent),
+            'blocked': dict(self.blocked),
+            'window_blocked': dict(self.window_blocked),
+            'used': len(self.consumed),
+            'wasted_pct': (self.n - len(self.consumed)) / self.n * 100.0,
+            'reuses': self.reuses,
+            'first_reuse': self.first_reuse,
+            'role_views': sorted(views),  # More than one: replicas disagree on roles
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asynchronous network simulation of the 3-party protocol")
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--d', type=int, default=50)
+    parser.add_argument('--latency', default='exp:1', help="const:x, exp:mean or uniform:lo:hi (time units)")
+    parser.add_argument('--rate', type=float, default=1.0, help="send attempts per time unit per active party")
+    parser.add_argument('--active', default='ABC', help="parties that talk, e.g. AC")
+    parser.add_argument('--window', type=int, default=None, help="max undelivered messages per party (default d)")
+    parser.add_argument('--max-events', type=int, default=None)
+    parser.add_argument('--max-time', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rates = {p: args.rate for p in args.active.upper()}
+    sim = NetworkSimulation(args.n, args.d, parse_latency(args.latency), rates, args.window, rng)
+    report = sim.run(args.max_events, args.max_time)
+
+    print(f"Network simulation: n={args.n}, d={args.d}, latency={args.latency}, rate={args.rate}, "
+          f"window={sim.window}, active={args.active.upper()}")
+    print(f"  Stopped     : {report['reason']} at t={report['sim_time']:.1f}")
+    print(f"  Events      : {report['events']} in {report['wall_time']:.2f}s "
+          f"({report['events_per_sec'] * 60 / 1e6:.2f}M/min, max queue {report['max_queue']})")
+    print(f"  Sent        : {report['sent']}")
+    print(f"  Blocked     : {report['blocked']}  (window: {report['window_blocked']})")
+    print(f"  Wastage     : {report['wasted_pct']:.2f}% ({report['used']}/{args.n} pads used)")
+    print(f"  Role views  : {', '.join(report['role_views'])}")
+    if report['reuses']:
+        first = report['first_reuse']
+        print(f"  SECRECY VIOLATION: {report['reuses']} reused pads "
+              f"(first: pad {first['pad']} by {first['party']} at t={first['time']:.2f})")
+    else:
+        print("  Secrecy     : OK (no pad reused)")
+
+
+if __name__ == "__main__":
+    main()
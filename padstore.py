@@ -0,0 +1,194 @@
+"""
+padstore.py - Key material behind the protocol's pad indices.
+A pad file holds n pads of pad_size random bytes; pad i (1..n, as returned by
+try_send) is bytes [(i - 1) * pad_size, i * pad_size). The file is memory-mapped,
+messages are XORed against it in bulk, and every used pad is zeroized and marked.
+Consumed ranges are journaled in a sidecar file (<path>.consumed) before the pads
+are zeroized, so a reopened store never hands out a used pad again.
+Uses numpy for the XOR when installed, Python ints otherwise.
+"""
+import mmap
+import os
+import struct
+from ledger import IntervalLedger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Zeroize in slices of this size (bounds the temporary zero buffer)
+ZERO_CHUNK = 1 << 20
+
+# Spans read back as all zeros are refused (zeroized by a store whose journal was lost).
+# Shorter spans are not checked: a few zero bytes are plausible pad material.
+ZERO_CHECK_MIN = 32
+ZERO_CHECK_CHUNK = 4096
+_ZEROS = memoryview(bytes(ZERO_CHECK_CHUNK))
+
+# Consumed-pad journal next to the pad file: one (lo, hi) record per consume()
+CONSUMED_SUFFIX = '.consumed'
+CONSUMED_RECORD = struct.Struct('<QQ')
+
+
+def create_pad_file(path, n, pad_size):
+    """Writes n pads of fresh random bytes to 'path'."""
+    remaining = n * pad_size
+    with open(path, 'wb') as f:
+        while remaining:
+            size = min(remaining, ZERO_CHUNK)
+            f.write(os.urandom(size))
+            remaining -= size
+
+
+class PadStore:
+    """
+    Memory-mapped pad file. A message longer than one pad uses consecutive pads
+    (e.g. a send_many range). Views returned by view() must be released before close().
+    The consumed-pad ledger is reloaded from the sidecar journal on open (and the
+    journal compacted to one record per interval); a pad file without its journal
+    is treated as fresh, so keep the two together.
+    """
+    def __init__(self, path, pad_size, backend=None):
+        if backend is None:
+            backend = 'numpy' if np is not None else 'int'
+        if backend == 'numpy' and np is None:
+            raise ImportError("backend='numpy' requires numpy")
+        self.pad_size = pad_size
+        self.backend = backend
+
+        self._file = open(path, 'r+b')
+        size = os.fstat(self._file.fileno()).st_size
+        self.n = size // pad_size
+        if self.n == 0:
+            self._file.close()
+            raise ValueError(f"{path} is smaller than one pad ({pad_size} bytes)")
+        self._mm = mmap.mmap(self._file.fileno(), self.n * pad_size)
+        self._view = memoryview(self._mm)
+        self.consumed = IntervalLedger(self.n)
+        self._journal_path = path + CONSUMED_SUFFIX
+        self._journal = None
+        try:
+            self._load_journal()
+        except (OSError, ValueError):
+            self.close()
+            raise
+
+    def _load_journal(self):
+        # Replay every record (a torn trailing record is dropped), then rewrite compacted
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, 'rb') as f:
+                data = f.read()
+            size = CONSUMED_RECORD.size
+            for offset in range(0, len(data) - len(data) % size, size):
+                lo, hi = CONSUMED_RECORD.unpack_from(data, offset)
+                if not 1 <= lo <= hi <= self.n:
+                    raise ValueError(f"{self._journal_path}: pads {lo}..{hi} outside 1..{self.n}")
+                self.consumed.add_range(lo, hi)
+        tmp = self._journal_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(CONSUMED_RECORD.pack(lo, hi) for lo, hi in self.consumed.intervals()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._journal_path)
+        self._journal = open(self._journal_path, 'ab')
+
+    def _span(self, index, length):
+        # Byte offset and last pad of 'length' bytes starting at pad 'index' (all unused)
+        last = index + max(1, -(-length // self.pad_size)) - 1
+        if index < 1 or last > self.n:
+            raise IndexError(f"Pads {index}..{last} outside 1..{self.n}")
+        gap = self.consumed.free_gap(index)
+        if gap is None or gap[1] < last:
+            raise ValueError(f"Pads {index}..{last} overlap consumed pads")
+        return (index - 1) * self.pad_size, last
+
+    def view(self, index, count=1):
+        """Zero-copy memoryview of 'count' pads from 'index' (nothing is consumed)."""
+        start, _ = self._span(index, count * self.pad_size)
+        return self._view[start:start + count * self.pad_size]
+
+    def xor(self, index, data, out=None):
+        """
+        XORs 'data' with the pads from 'index' on and consumes them.
+        Encryption and decryption are the same operation.
+        out: writable buffer of len(data) (may be 'data' itself); a new bytearray if None.
+        """
+        length = len(data)
+        start, last = self._span(index, length)
+        end = last * self.pad_size
+        if self._zeroized(start, end):
+            # Zeroized on disk: consumed by a session whose journal was lost
+            raise ValueError(f"Pads {index}..{last} read back as zeros (already consumed)")
+        if out is None:
+            out = bytearray(length)
+        pad = self._view[start:start + length]
+        try:
+            if self.backend == 'numpy':
+                np.bitwise_xor(np.frombuffer(data, dtype=np.uint8), np.frombuffer(pad, dtype=np.uint8),
+                               out=np.frombuffer(out, dtype=np.uint8))
+            else:
+                out[:] = (int.from_bytes(data, 'little') ^ int.from_bytes(pad, 'little')).to_bytes(length, 'little')
+        finally:
+            pad.release()
+        self.consume(index, last)
+        return out
+
+    def _zeroized(self, start, end):
+        # Chunk by chunk against a shared zero buffer: random pads differ at the first bytes
+        if end - start < ZERO_CHECK_MIN:
+            return False
+        for pos in range(start, end, ZERO_CHECK_CHUNK):
+            size = min(ZERO_CHECK_CHUNK, end - pos)
+            if self._view[pos:pos + size] != _ZEROS[:size]:
+                return False
+        return True
+
+    encrypt = xor
+    decrypt = xor
+
+    def consume(self, lo, hi):
+        """Zeroizes pads lo..hi and marks them used (also for pads wasted unused)."""
+        # Journal first: a crash after this point can only lose pads, never reuse them
+        self._journal.write(CONSUMED_RECORD.pack(lo, hi))
+        self._journal.flush()
+        start = (lo - 1) * self.pad_size
+        end = hi * self.pad_size
+        if self.backend == 'numpy':
+            np.frombuffer(self._mm, dtype=np.uint8, count=end - start, offset=start).fill(0)
+        else:
+            for offset in range(start, end, ZERO_CHUNK):
+                size = min(ZERO_CHUNK, end - offset)
+                self._view[offset:offset + size] = bytes(size)
+        self.consumed.add_range(lo, hi)
+
+    def send(self, protocol, party, data):
+        """
+        Allocates the next pad of 'party' from 'protocol' and encrypts 'data' (one pad) with it.
+        Returns: (pad index, ciphertext), or None if the party is blocked.
+        """
+        if len(data) > self.pad_size:
+            raise ValueError(f"Message of {len(data)} bytes exceeds the pad size ({self.pad_size})")
+        pad = protocol.try_send(party)
+        if pad is None:
+            return None
+        return pad, self.xor(pad, data)
+
+    def flush(self):
+        self._mm.flush()
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+        self._view.release()
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,9 +2,24 @@
 3-Party One-Time Pad Protocol
 SINGLE SOURCE OF TRUTH - Contains all logic fixes.
 """
+import struct
+import sys
+from array import array
+from ledger import IntervalLedger
+
+INF = float('inf')
+
+# snapshot() layout (little-endian): header | STATE | used pad intervals (uint64 lo, hi pairs)
+# Header: magic, format version, roles (left, middle, right letters), has_sent bits,
+# bits of parties with middle boundaries
+SNAPSHOT_MAGIC = b'OTPS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sB3sBB')
+# n, d, version, last_used x3, middle left/right boundaries x3 each, messages_sent x3, interval count
+SNAPSHOT_STATE = struct.Struct('<16Q')
 
 class ThreePartyProtocol:
-    def __init__(self, n, d):
+    def __init__(self, n, d, ledger=IntervalLedger, metrics=None):
         self.n = n
         self.d = d
         self.parties = ['A', 'B', 'C']
@@ -27,9 +42,22 @@ class ThreePartyProtocol:
         self.middle_left_boundary[self.middle_party] = n // 2
         self.middle_right_boundary[self.middle_party] = n // 2
         
-        self.used_pads = set()
+        # Consumed pads (see ledger.py). Pass ledger=SetLedger for the original set.
+        self.used_pads = ledger(n)
         self.messages_sent = {'A': 0, 'B': 0, 'C': 0}
         
+        # Next-position cache: party -> (position, safe).
+        # Cleared whenever the state changes (sends, role swaps).
+        self._next_cache = {}
+        
+        # State version: +1 per consumed pad and per role swap (for delta sync)
+        self.version = 0
+        
+        # Optional instrumentation (metrics.ProtocolMetrics); None disables it
+        self.metrics = metrics
+        if metrics is not None and metrics.timing:
+            metrics.instrument(self)
+        
     def get_next_position(self, party):
         current_pos = self.last_used[party]
         
@@ -68,22 +96,34 @@ class ThreePartyProtocol:
     
     def check_safety(self, party, position):
         if position < 1 or position > self.n: return False
-        if position in self.used_pads: return False
+        d = self.d
+        
+        # Check against the two roles 'party' does not hold.
+        # FIX: Passive Boundary Safety
+        # Respect boundaries even if other party hasn't sent.
+        middle = self.middle_party
+        if party != middle:
+            if abs(position - self.middle_left_boundary[middle]) <= d: return False
+            if abs(position - self.middle_right_boundary[middle]) <= d: return False
+        if party != self.left_party and abs(position - self.last_used[self.left_party]) <= d: return False
+        if party != self.right_party and abs(position - self.last_used[self.right_party]) <= d: return False
         
-        for other in self.parties:
-            if other != party:
-                # FIX: Passive Boundary Safety
-                # Respect boundaries even if other party hasn't sent.
-                if other == self.middle_party:
-                    lb = self.middle_left_boundary[other]
-                    rb = self.middle_right_boundary[other]
-                    if abs(position - lb) <= self.d: return False
-                    if abs(position - rb) <= self.d: return False
-                else:
-                    other_pos = self.last_used[other]
-                    if abs(position - other_pos) <= self.d: return False
+        if position in self.used_pads: return False
         return True
     
+    def block_reason(self, party, position):
+        """Why check_safety rejects 'position' for 'party' (metrics.BLOCK_REASONS), or None if safe."""
+        if position < 1 or position > self.n: return 'out_of_range'
+        d = self.d
+        middle = self.middle_party
+        if party != middle:
+            if abs(position - self.middle_left_boundary[middle]) <= d: return 'buffer_middle'
+            if abs(position - self.middle_right_boundary[middle]) <= d: return 'buffer_middle'
+        if party != self.left_party and abs(position - self.last_used[self.left_party]) <= d: return 'buffer_left'
+        if party != self.right_party and abs(position - self.last_used[self.right_party]) <= d: return 'buffer_right'
+        if position in self.used_pads: return 'reused'
+        return None
+    
     def reposition_if_needed(self):
         # FIX: Reposition checks against un-moved parties too
         left_pos = self.last_used[self.left_party]
@@ -113,6 +153,8 @@ class ThreePartyProtocol:
                 self.has_sent[old_left] = True
                 self.middle_left_boundary[old_left] = new_pos
                 self.middle_right_boundary[old_left] = new_pos
+                self._next_cache.clear()
+                self.version += 1
                 return True
         
         # Middle <-> Right Trigger
@@ -134,32 +176,324 @@ class ThreePartyProtocol:
                 self.has_sent[old_right] = True
                 self.middle_left_boundary[old_right] = new_pos
                 self.middle_right_boundary[old_right] = new_pos
+                self._next_cache.clear()
+                self.version += 1
                 return True
         
         return False
     
+    def _evaluate(self, party):
+        # (next position, safe) for party, computed at most once per state
+        cached = self._next_cache.get(party)
+        if cached is None:
+            next_pos = self.get_next_position(party)
+            cached = (next_pos, self.check_safety(party, next_pos))
+            self._next_cache[party] = cached
+        return cached
+    
     def can_send(self, party):
-        next_pos = self.get_next_position(party)
-        return self.check_safety(party, next_pos)
+        return self._evaluate(party)[1]
     
-    def send_message(self, party):
-        if not self.can_send(party): return None
-        
-        next_pos = self.get_next_position(party)
+    def try_send(self, party):
+        """
+        Sends one message from 'party' with a single next-position evaluation.
+        Returns: the pad used, or None if blocked.
+        """
+        next_pos, safe = self._evaluate(party)
+        if not safe:
+            if self.metrics is not None:
+                self.metrics.blocks[self.block_reason(party, next_pos)] += 1
+            return None
+        self.apply_send(party, next_pos)
+        return next_pos
+    
+    def apply_send(self, party, pad):
+        """
+        Records that 'party' consumed 'pad' without any safety check.
+        try_send commits through here; a replica (see netsim.py) uses it
+        for sends delivered from other parties.
+        Returns: True if the send triggered a role swap.
+        """
+        self._next_cache.clear()
+        self.version += 1
         
-        self.last_used[party] = next_pos
+        self.last_used[party] = pad
         self.has_sent[party] = True
-        self.used_pads.add(next_pos)
+        self.used_pads.add(pad)
         self.messages_sent[party] += 1
         
         if party == self.middle_party:
-            if next_pos < self.middle_left_boundary[party]:
-                self.middle_left_boundary[party] = next_pos
-            if next_pos > self.middle_right_boundary[party]:
-                self.middle_right_boundary[party] = next_pos
+            if pad < self.middle_left_boundary[party]:
+                self.middle_left_boundary[party] = pad
+            if pad > self.middle_right_boundary[party]:
+                self.middle_right_boundary[party] = pad
         
-        self.reposition_if_needed()
-        return next_pos
+        swapped = self.reposition_if_needed()
+        if self.metrics is not None:
+            self.metrics.sends += 1
+            self.metrics.swaps += swapped
+        return swapped
+    
+    def send_message(self, party):
+        return self.try_send(party)
+
+    # --- Bulk Sending (send_many) ---
+    # Between two role swaps every role moves in a fixed pattern: ends step by 1,
+    # the middle alternates towards the larger gap. Each safety/trigger check is
+    # then an interval test on a step counter, so the first blocking or swapping
+    # step of a run can be computed directly instead of stepping through it.
+
+    @staticmethod
+    def _first_entry(start, step, lo, hi):
+        # First s >= 1 with start + step*s inside [lo, hi] (inf if never)
+        if lo > hi: return INF
+        if step > 0:
+            if start + 1 > hi: return INF
+            return max(1, lo - start)
+        if start - 1 < lo: return INF
+        return max(1, start - hi)
+
+    @staticmethod
+    def _middle_counts(skew, s):
+        # (left steps, right steps) after s middle sends; skew = left_gap - right_gap
+        if skew > 0:
+            if s <= skew: return s, 0
+            s -= skew
+            return skew + s // 2, (s + 1) // 2
+        if s <= -skew: return 0, s
+        s += skew
+        return s // 2, -skew + (s + 1) // 2
+
+    @staticmethod
+    def _middle_first_step(skew, t, left):
+        # First step s at which the left (or right) step count reaches t (0 if t <= 0)
+        if t <= 0: return 0
+        if t == INF: return INF
+        if skew > 0:
+            if left: return t if t <= skew else skew + 2 * (t - skew)
+            return skew + 2 * t - 1
+        m = -skew
+        if left: return m + 2 * t
+        return t if t <= m else m + 2 * (t - m) - 1
+
+    def _first_used_step(self, start, step):
+        # First s >= 1 whose position start + step*s is already used
+        gap = self.used_pads.free_gap(start + step)
+        if gap is None: return 1
+        return (gap[1] - start + 1) if step > 0 else (start - gap[0] + 1)
+
+    def _end_run(self, party, limit):
+        d = self.d
+        threshold = d + 1
+        cur = self.last_used[party]
+        left_pos = self.last_used[self.left_party]
+        right_pos = self.last_used[self.right_party]
+        lb = self.middle_left_boundary[self.middle_party]
+        rb = self.middle_right_boundary[self.middle_party]
+
+        if party == self.left_party:
+            step, other = 1, right_pos
+            out_of_range = self.n - cur + 1
+            # Left <-> Middle fires once we enter lb's dead zone, Middle <-> Right only on the first step
+            fire_left = self._first_entry(cur, 1, lb - threshold, lb + threshold) if right_pos - rb > d * 2 else INF
+            fire_right = self._first_entry(cur, 1, -INF, lb - d * 2 - 1) if abs(right_pos - rb) <= threshold else INF
+        else:
+            step, other = -1, left_pos
+            out_of_range = cur
+            fire_left = self._first_entry(cur, -1, rb + d * 2 + 1, INF) if abs(lb - left_pos) <= threshold else INF
+            fire_right = self._first_entry(cur, -1, rb - threshold, rb + threshold) if lb - left_pos > d * 2 else INF
+
+        unsafe = min(
+            out_of_range,
+            self._first_used_step(cur, step),
+            self._first_entry(cur, step, lb - d, lb + d),
+            self._first_entry(cur, step, rb - d, rb + d),
+            self._first_entry(cur, step, other - d, other + d),
+        )
+        return min(limit, unsafe - 1, min(fire_left, fire_right) - 1)
+
+    def _middle_run(self, party, limit):
+        d = self.d
+        threshold = d + 1
+        left_pos = self.last_used[self.left_party]
+        right_pos = self.last_used[self.right_party]
+        lb = self.middle_left_boundary[party]
+        rb = self.middle_right_boundary[party]
+
+        # Middle Spot is a one-off step; leave it to send_message
+        if lb == rb and lb not in self.used_pads: return 0
+
+        skew = (lb - left_pos - 1) - (right_pos - rb - 1)
+        first = lambda t, left: self._middle_first_step(skew, t, left)
+
+        def unsafe_count(start, step, out_of_range):
+            return min(
+                out_of_range,
+                self._first_used_step(start, step),
+                self._first_entry(start, step, left_pos - d, left_pos + d),
+                self._first_entry(start, step, right_pos - d, right_pos + d),
+            )
+
+        unsafe = min(first(unsafe_count(lb, -1, lb), True),
+                     first(unsafe_count(rb, 1, self.n - rb + 1), False))
+
+        def fire(dead_zone, dead_left, gap_limit, gap_left):
+            # First step where the dead-zone count is in range while the far gap is still > 2d
+            lower = max(1, first(dead_zone[0], dead_left))
+            upper = min(first(dead_zone[1] + 1, dead_left), first(gap_limit + 1, gap_left)) - 1
+            return lower if lower <= upper else INF
+
+        # Left <-> Middle: lb within threshold of left_pos while right_pos - rb > 2d
+        fire_left = fire((lb - left_pos - threshold, lb - left_pos + threshold), True,
+                         right_pos - rb - d * 2 - 1, False)
+        # Middle <-> Right: rb within threshold of right_pos while lb - left_pos > 2d
+        fire_right = fire((right_pos - rb - threshold, right_pos - rb + threshold), False,
+                          lb - left_pos - d * 2 - 1, True)
+        return min(limit, unsafe - 1, min(fire_left, fire_right) - 1)
+
+    def _commit_run(self, party, count):
+        # Apply 'count' swap-free sends at once. Returns the pad ranges consumed.
+        self._next_cache.clear()
+        self.version += count
+        if self.metrics is not None:
+            self.metrics.sends += count
+        self.has_sent[party] = True
+        self.messages_sent[party] += count
+
+        if party != self.middle_party:
+            cur = self.last_used[party]
+            if party == self.left_party:
+                lo, hi, self.last_used[party] = cur + 1, cur + count, cur + count
+            else:
+                lo, hi, self.last_used[party] = cur - count, cur - 1, cur - count
+            self.used_pads.add_range(lo, hi)
+            return [(lo, hi)]
+
+        lb = self.middle_left_boundary[party]
+        rb = self.middle_right_boundary[party]
+        left_pos = self.last_used[self.left_party]
+        right_pos = self.last_used[self.right_party]
+        skew = (lb - left_pos - 1) - (right_pos - rb - 1)
+        went_left, went_right = self._middle_counts(skew, count)
+        prev_left, _ = self._middle_counts(skew, count - 1)
+
+        ranges = []
+        if went_left:
+            ranges.append((lb - went_left, lb - 1))
+        if went_right:
+            ranges.append((rb + 1, rb + went_right))
+        for lo, hi in ranges:
+            self.used_pads.add_range(lo, hi)
+        self.middle_left_boundary[party] = lb - went_left
+        self.middle_right_boundary[party] = rb + went_right
+        self.last_used[party] = lb - went_left if went_left > prev_left else rb + went_right
+        return ranges
+
+    def send_many(self, party, k):
+        """
+        Sends k messages from 'party' in a row, committing swap-free runs in bulk.
+        Only the steps that swap roles or block go through send_message,
+        so the cost is O(number of swaps) rather than O(k).
+        Returns: {'sent', 'blocked', 'ranges'} with the inclusive pad ranges used.
+        """
+        sent = 0
+        ranges = []
+        while sent < k:
+            if party == self.middle_party:
+                run = self._middle_run(party, k - sent)
+            else:
+                run = self._end_run(party, k - sent)
+            if run > 0:
+                ranges.extend(self._commit_run(party, run))
+                sent += run
+                continue
+
+            pos = self.send_message(party)
+            if pos is None:
+                # Nobody else moves, so every remaining message is blocked too
+                break
+            ranges.append((pos, pos))
+            sent += 1
+
+        return {'sent': sent, 'blocked': k - sent, 'ranges': ranges}
+
+    # --- Snapshots ---
+
+    def snapshot(self):
+        """Compact binary copy of the full state (see SNAPSHOT_* above); restore() reads it back."""
+        parties = self.parties
+        has_sent = sum(1 << i for i, p in enumerate(parties) if self.has_sent[p])
+        bounds = sum(1 << i for i, p in enumerate(parties) if p in self.middle_left_boundary)
+        intervals = self.used_pads.intervals()
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                      (self.left_party + self.middle_party + self.right_party).encode('ascii'),
+                                      has_sent, bounds)
+        state = SNAPSHOT_STATE.pack(
+            self.n, self.d, self.version,
+            *[self.last_used[p] for p in parties],
+            *[self.middle_left_boundary.get(p, 0) for p in parties],
+            *[self.middle_right_boundary.get(p, 0) for p in parties],
+            *[self.messages_sent[p] for p in parties],
+            len(intervals))
+        pads = array('Q', [x for interval in intervals for x in interval])
+        if sys.byteorder != 'little':
+            pads.byteswap()
+        return header + state + pads.tobytes()
+
+    @classmethod
+    def restore(cls, data, ledger=IntervalLedger, metrics=None):
+        """Protocol rebuilt from snapshot() bytes."""
+        magic, version, roles, has_sent, bounds = SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("Not a protocol snapshot")
+        state = SNAPSHOT_STATE.unpack_from(data, SNAPSHOT_HEADER.size)
+        n, d, state_version = state[:3]
+        count = state[15]
+        pads = array('Q')
+        offset = SNAPSHOT_HEADER.size + SNAPSHOT_STATE.size
+        pads.frombytes(data[offset:offset + 16 * count])
+        if sys.byteorder != 'little':
+            pads.byteswap()
+
+        protocol = cls(n, d, ledger, metrics)
+        parties = protocol.parties
+        protocol.left_party, protocol.middle_party, protocol.right_party = roles.decode('ascii')
+        protocol.middle_left_boundary = {}
+        protocol.middle_right_boundary = {}
+        for i, p in enumerate(parties):
+            protocol.has_sent[p] = bool(has_sent & (1 << i))
+            protocol.last_used[p] = state[3 + i]
+            if bounds & (1 << i):
+                protocol.middle_left_boundary[p] = state[6 + i]
+                protocol.middle_right_boundary[p] = state[9 + i]
+            protocol.messages_sent[p] = state[12 + i]
+        for i in range(0, len(pads), 2):
+            protocol.used_pads.add_range(pads[i], pads[i + 1])
+        protocol.version = state_version
+        protocol._next_cache.clear()
+        return protocol
+
+    def fork(self, metrics=None):
+        """Independent in-memory copy (ledger.copy(), no serialization) to branch a search/simulation from."""
+        other = self.__class__.__new__(self.__class__)
+        other.n = self.n
+        other.d = self.d
+        other.parties = list(self.parties)
+        other.last_used = dict(self.last_used)
+        other.middle_left_boundary = dict(self.middle_left_boundary)
+        other.middle_right_boundary = dict(self.middle_right_boundary)
+        other.has_sent = dict(self.has_sent)
+        other.left_party = self.left_party
+        other.middle_party = self.middle_party
+        other.right_party = self.right_party
+        other.used_pads = self.used_pads.copy()
+        other.messages_sent = dict(self.messages_sent)
+        other._next_cache = dict(self._next_cache)  # Same state, same answers
+        other.version = self.version
+        other.metrics = metrics
+        if metrics is not None and metrics.timing:
+            metrics.instrument(other)
+        return other
 
     def get_stats(self):
         return {
@@ -0,0 +1,279 @@
+"""
+replay.py - Deterministic schedule logs, fast replay and differential testing.
+A log records (seed, n, d) and every send attempt in order, 2 bits per attempt;
+several logs may be concatenated in one file. Replaying needs no RNG: blocked
+attempts change nothing, so runs of one party go through send_many.
+The differential mode replays the same logs on two implementations and reports
+the first step where they disagree.
+
+Run: python replay.py record --n 1000 --d 10 --active AC --seed 7 --out ac.otplog
+     python replay.py run ac.otplog [--impl protocol:ThreePartyProtocol]
+     python replay.py diff ac.otplog --a old_protocol:ThreePartyProtocol --b protocol:ThreePartyProtocol
+"""
+import argparse
+import importlib
+import random
+import re
+import struct
+import time
+from ledger import IntervalLedger, SetLedger
+
+PARTIES = 'ABC'
+
+LOG_MAGIC = b'OTPL'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<4sB3xQIII')  # magic, version, seed, n, d, attempts
+
+# Byte <-> 4 attempts (first attempt in the low bits); code 3 is padding
+_UNPACK = [''.join('ABC?'[(b >> s) & 3] for s in (0, 2, 4, 6)) for b in range(256)]
+_PACK = {chunk: b for b, chunk in enumerate(_UNPACK) if '?' not in chunk}
+_RUNS = re.compile('A+|B+|C+')
+
+# Shorter runs are cheaper as plain try_send calls than through send_many
+BULK_MIN_RUN = 8
+
+LEDGERS = {'interval': IntervalLedger, 'set': SetLedger}
+
+
+def encode_log(seed, n, d, schedule):
+    """Log bytes for 'schedule' (a string or sequence of 'A'/'B'/'C')."""
+    schedule = ''.join(schedule)
+    count = len(schedule)
+    full = count - count % 4
+    body = bytearray(_PACK[schedule[i:i + 4]] for i in range(0, full, 4))
+    if full < count:
+        tail = 0
+        for shift, party in enumerate(schedule[full:]):
+            tail |= PARTIES.index(party) << (2 * shift)
+        body.append(tail | sum(3 << (2 * s) for s in range(count - full, 4)))
+    return LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, seed, n, d, count) + bytes(body)
+
+
+def decode_logs(data):
+    """Yields (seed, n, d, schedule string) for each log in 'data'."""
+    offset = 0
+    while offset < len(data):
+        magic, version, seed, n, d, count = LOG_HEADER.unpack_from(data, offset)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"Not a schedule log at byte {offset}")
+        offset += LOG_HEADER.size
+        size = -(-count // 4)
+        body = data[offset:offset + size]
+        if len(body) < size:
+            raise ValueError("Truncated schedule log")
+        yield seed, n, d, ''.join([_UNPACK[b] for b in body])[:count]
+        offset += size
+
+
+def read_logs(path):
+    with open(path, 'rb') as f:
+        return list(decode_logs(f.read()))
+
+
+def record_simulation(n, d, active_subset, seed):
+    """Runs suite.run_simulation with random.Random(seed); returns (wastage %, log bytes)."""
+    from suite import run_simulation
+    schedule = []
+    wastage = run_simulation(n, d, active_subset, random.Random(seed), schedule)
+    return wastage, encode_log(seed, n, d, schedule)
+
+
+class Implementation:
+    """
+    A protocol class to replay against, from 'module:Class[,ledger][,step]'.
+    'ledger' is interval or set (passed as ledger=, so only for classes that take one);
+    'step' replays one send per attempt instead of send_many.
+
+    Contract, met by every version of ThreePartyProtocol: Class(n, d); try_send(party)
+    or send_message(party) returning the pad or None; left_party / middle_party /
+    right_party, last_used, middle_left_boundary / middle_right_boundary, used_pads
+    (a set or a ledger) and get_stats(). send_many(party, k) is used when present.
+    """
+    def __init__(self, spec):
+        target, *options = spec.split(',')
+        module_name, _, class_name = target.partition(':')
+        self.spec = spec
+        self.cls = getattr(importlib.import_module(module_name), class_name or 'ThreePartyProtocol')
+        self.ledger = None
+        self.bulk = hasattr(self.cls, 'send_many')
+        for option in options:
+            if option == 'step':
+                self.bulk = False
+            elif option in LEDGERS:
+                self.ledger = LEDGERS[option]
+            else:
+                raise ValueError(f"Unknown option '{option}' in '{spec}'")
+
+    def create(self, n, d):
+        if self.ledger is None:
+            return self.cls(n, d)
+        return self.cls(n, d, ledger=self.ledger)
+
+
+def sender(protocol):
+    # try_send, or send_message on versions that predate it
+    send = getattr(protocol, 'try_send', None)
+    return send if send is not None else protocol.send_message
+
+
+def used_intervals(protocol):
+    """Consumed pads as inclusive (lo, hi) intervals, for ledgers and plain sets alike."""
+    used = protocol.used_pads
+    if hasattr(used, 'intervals'):
+        return used.intervals()
+    result = []
+    for pad in sorted(used):
+        if result and result[-1][1] == pad - 1:
+            result[-1] = (result[-1][0], pad)
+        else:
+            result.append((pad, pad))
+    return result
+
+
+def fingerprint(protocol):
+    # Cheap per-run state summary; the full ledgers are only compared at the end
+    middle = protocol.middle_party
+    return (protocol.left_party, middle, protocol.right_party,
+            tuple(protocol.last_used[p] for p in PARTIES),
+            protocol.middle_left_boundary.get(middle), protocol.middle_right_boundary.get(middle),
+            len(protocol.used_pads))
+
+
+def run_steps(protocol, schedule, bulk=True):
+    """Applies 'schedule' to 'protocol'. Returns: number of blocked attempts."""
+    blocked = 0
+    try_send = sender(protocol)
+    if not bulk:
+        for party in schedule:
+            if try_send(party) is None:
+                blocked += 1
+        return blocked
+
+    for run in _RUNS.finditer(schedule):
+        party = run.group()[0]
+        count = run.end() - run.start()
+        if count >= BULK_MIN_RUN:
+            blocked += protocol.send_many(party, count)['blocked']
+        else:
+            for _ in range(count):
+                if try_send(party) is None:
+                    blocked += 1
+    return blocked
+
+
+def replay(n, d, schedule, impl):
+    """Re-executes one log. Returns: stats dict (get_stats() plus blocked, attempts, seconds)."""
+    start = time.perf_counter()
+    protocol = impl.create(n, d)
+    blocked = run_steps(protocol, schedule, impl.bulk)
+    elapsed = time.perf_counter() - start
+    stats = protocol.get_stats()
+    stats.update({'blocked': blocked, 'attempts': len(schedule), 'seconds': elapsed})
+    return stats
+
+
+def _step_state(protocol, pad):
+    left, middle, right, last_used, left_bound, right_bound, used = fingerprint(protocol)
+    return {'pad': pad, 'roles': left + middle + right, 'last_used': last_used,
+            'middle': (left_bound, right_bound), 'used': used}
+
+
+def diff(n, d, schedule, impl_a, impl_b):
+    """
+    Replays one log on both implementations, comparing after every run of one party.
+    Returns: None if they agree, else {'step', 'party', 'a', 'b'} for the first
+    divergent attempt (step None if only the final ledgers differ).
+    """
+    a, b = impl_a.create(n, d), impl_b.create(n, d)
+    runs = [(m.start(), m.end()) for m in _RUNS.finditer(schedule)]
+    for start, end in runs:
+        run = schedule[start:end]
+        run_steps(a, run, impl_a.bulk)
+        run_steps(b, run, impl_b.bulk)
+        if fingerprint(a) != fingerprint(b):
+            return _locate(n, d, schedule, impl_a, impl_b, start, end)
+
+    if used_intervals(a) != used_intervals(b) or a.get_stats() != b.get_stats():
+        return {'step': None, 'party': None,
+                'a': {'used': len(a.used_pads), 'stats': a.get_stats()},
+                'b': {'used': len(b.used_pads), 'stats': b.get_stats()}}
+    return None
+
+
+def _locate(n, d, schedule, impl_a, impl_b, start, end):
+    # Fresh replicas fast-forwarded to 'start', then one attempt at a time
+    a, b = impl_a.create(n, d), impl_b.create(n, d)
+    run_steps(a, schedule[:start], impl_a.bulk)
+    run_steps(b, schedule[:start], impl_b.bulk)
+    for step in range(start, end):
+        party = schedule[step]
+        state_a = _step_state(a, sender(a)(party))
+        state_b = _step_state(b, sender(b)(party))
+        if state_a != state_b:
+            return {'step': step, 'party': party, 'a': state_a, 'b': state_b}
+    # Only the bulk path diverged: the run as a whole differs
+    return {'step': start, 'party': schedule[start], 'a': {'run': (start, end)}, 'b': {'run': (start, end)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule logs: record, replay, differential test")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help="record run_simulation schedules")
+    record.add_argument('--n', type=int, default=1000)
+    record.add_argument('--d', type=int, default=10)
+    record.add_argument('--active', default='ABC')
+    record.add_argument('--seed', type=int, default=0)
+    record.add_argument('--runs', type=int, default=1, help="logs to record (seeds seed, seed+1, ...)")
+    record.add_argument('--out', required=True)
+
+    run = commands.add_parser('run', help="replay logs")
+    run.add_argument('logs', nargs='+')
+    run.add_argument('--impl', default='protocol:ThreePartyProtocol', help="module:Class[,interval|set][,step]")
+
+    compare = commands.add_parser('diff', help="replay logs on two implementations")
+    compare.add_argument('logs', nargs='+')
+    compare.add_argument('--a', default='protocol:ThreePartyProtocol,step')
+    compare.add_argument('--b', default='protocol:ThreePartyProtocol')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        with open(args.out, 'wb') as f:
+            for seed in range(args.seed, args.seed + args.runs):
+                wastage, log = record_simulation(args.n, args.d, list(args.active.upper()), seed)
+                f.write(log)
+                print(f"seed {seed}: {wastage:.2f}% wastage, {len(log)} bytes")
+        return
+
+    if args.command == 'run':
+        impl = Implementation(args.impl)
+        attempts = 0
+        elapsed = 0.0
+        for path in args.logs:
+            for seed, n, d, schedule in read_logs(path):
+                stats = replay(n, d, schedule, impl)
+                attempts += stats['attempts']
+                elapsed += stats['seconds']
+                print(f"{path} seed={seed} n={n} d={d}: {stats['attempts']} attempts, "
+                      f"{stats['blocked']} blocked, {stats['used']} used, {stats['efficiency']:.2f}% wasted")
+        print(f"Replayed {attempts} attempts in {elapsed:.3f}s ({attempts / elapsed / 1e6 if elapsed else 0:.2f}M/s)")
+        return
+
+    impl_a, impl_b = Implementation(args.a), Implementation(args.b)
+    failures = 0
+    for path in args.logs:
+        for seed, n, d, schedule in read_logs(path):
+            result = diff(n, d, schedule, impl_a, impl_b)
+            if result is None:
+                continue
+            failures += 1
+            print(f"{path} seed={seed} n={n} d={d}: DIVERGED at step {result['step']} (party {result['party']})")
+            print(f"  {impl_a.spec}: {result['a']}")
+            print(f"  {impl_b.spec}: {result['b']}")
+    if failures:
+        raise SystemExit(1)
+    print(f"{impl_a.spec} and {impl_b.spec} agree on every log")
+
+
+if __name__ == "__main__":
+    main()
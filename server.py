@@ -1,116 +1,360 @@
 """
 Simple HTTP Server to bridge the Web UI with protocol.py
-Run: python server.py
+Run: python server.py [--port 8000]
 Then open http://localhost:8000
+
+Each /init creates a session; /run takes the returned session id.
+Requests are served on threads, one lock per session.
+/run with "stream": "ndjson" or "sse" writes step records incrementally (a batch
+always runs to the end and is saved, even if the client disconnects);
+"every": k and "events_only": true downsample the trace.
+"format": "packed" (base64 in JSON) or "binary" (raw body) uses codec.py's columnar trace.
+/delta returns only the pads and role swaps since a client-held protocol version.
+--state-dir keeps sessions on disk (saved after every /run) so they survive restarts.
+/log returns the session's seed and every send attempt as a replay.py log (binary).
+/init takes an optional "seed"; shuffles are derived from it, so sessions are reproducible.
+GET /metrics serves protocol counters (all sessions) and request latencies in Prometheus text format.
 """
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import argparse
+import base64
 import json
 import random
-from protocol import ThreePartyProtocol
+import sys
+import time
+from codec import encode_trace, PARTY_CODES
+from metrics import Histogram, render_protocol
+from sessions import SessionStore
+
+# Global state (replaced in __main__ from the command line)
+sessions = SessionStore()
+
+# Step records per chunk when streaming /run
+STREAM_FLUSH_STEPS = 256
 
-# Global state
-active_protocol = None
-blocked_counts = {'A': 0, 'B': 0, 'C': 0}
+# Max pads per /delta reply; clients keep asking while 'more' is set
+DELTA_LIMIT = 262144
+
+# Request latency per POST endpoint
+REQUEST_LATENCY = {path: Histogram() for path in ('/init', '/run', '/delta', '/log')}
 
 class ProtocolHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 for chunked streaming; every other reply sets Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY a keep-alive
+    # client waits out its delayed ACK (~40 ms) on every reply
+    disable_nagle_algorithm = True
+
     def do_GET(self):
+        if self.path == '/metrics':
+            body = metrics_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
         if self.path == '/':
             self.path = 'index.html'
         return SimpleHTTPRequestHandler.do_GET(self)
 
     def do_POST(self):
-        global active_protocol, blocked_counts
+        start = time.perf_counter()
+        try:
+            self.handle_post()
+        finally:
+            histogram = REQUEST_LATENCY.get(self.path)
+            if histogram is not None:
+                histogram.observe(time.perf_counter() - start)
+
+    def handle_post(self):
         content_length = int(self.headers['Content-Length'])
         post_data = self.rfile.read(content_length)
         data = json.loads(post_data.decode('utf-8'))
         
-        response = {}
-        
         if self.path == '/init':
             n = int(data.get('n', 100))
             d = int(data.get('d', 5))
-            active_protocol = ThreePartyProtocol(n, d)
-            # Reset blocked counts
-            blocked_counts = {'A': 0, 'B': 0, 'C': 0}
-            response = {'status': 'ok', 'msg': 'Protocol Initialized'}
+            seed = data.get('seed')
+            if seed is not None:
+                seed = int(seed)
+                if not 0 <= seed < 2**64:
+                    # /log headers store the seed as a uint64
+                    self.send_error(400, "seed must be in [0, 2**64)")
+                    return
+            session = sessions.create(n, d, seed)
+            response = {'status': 'ok', 'msg': 'Protocol Initialized', 'session': session.id, 'seed': session.seed}
             
-        elif self.path == '/run':
-            if not active_protocol:
-                self.send_error(400, "Protocol not initialized")
+        elif self.path == '/delta':
+            session = sessions.get(data.get('session'))
+            if session is None:
+                self.send_error(404, "Unknown or expired session")
                 return
+            # Lock-free: the journal is append-only, so a concurrent /run is never blocked
+            response = delta(session, int(data.get('since', 0)), int(data.get('limit', DELTA_LIMIT)))
 
-            # Get inputs
-            a_count = int(data.get('a', 0))
-            b_count = int(data.get('b', 0))
-            c_count = int(data.get('c', 0))
-            shuffle_mode = data.get('shuffle', False)
-            
-            # Create batch schedule
-            schedule = []
-            schedule.extend(['A'] * a_count)
-            schedule.extend(['B'] * b_count)
-            schedule.extend(['C'] * c_count)
-            
-            if shuffle_mode:
-                random.shuffle(schedule)
-            
-            trace = []
-            protocol_blocked = False
-            blocked_party_trigger = None
-            
-            for party in schedule:
-                step_data = {
-                    'party': party,
-                    'success': False,
-                    'pad': None,
-                    'state': None,
-                    'left_p': active_protocol.left_party,
-                    'mid_p': active_protocol.middle_party,
-                    'right_p': active_protocol.right_party
-                }
-                
-                if active_protocol.can_send(party):
-                    pad = active_protocol.send_message(party)
-                    if pad is not None:
-                        step_data['success'] = True
-                        step_data['pad'] = pad
-                        # Serialize state for UI
-                        if party == active_protocol.middle_party:
-                            step_data['state'] = [
-                                active_protocol.middle_left_boundary[party],
-                                active_protocol.middle_right_boundary[party]
-                            ]
-                        else:
-                            step_data['state'] = active_protocol.last_used[party]
+        elif self.path == '/log':
+            session = sessions.get(data.get('session'))
+            if session is None:
+                self.send_error(404, "Unknown or expired session")
+                return
+            with session.lock:
+                body = session.log_bytes()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        elif self.path == '/run':
+            session = sessions.get(data.get('session'))
+            if session is None:
+                self.send_error(404, "Unknown or expired session")
+                return
+            mode = data.get('stream')
+            trace_format = data.get('format', 'json')
+            # Batches always run to the end and are saved, even if the client goes away
+            with session.lock:
+                try:
+                    if mode in ('ndjson', 'sse'):
+                        self.stream_batch(session, data, mode)
+                    elif trace_format == 'binary':
+                        body, summary = self.binary_batch(session, data)
                     else:
-                        # Logic error catch
-                        protocol_blocked = True
-                        blocked_party_trigger = party
-                        blocked_counts[party] += 1
-                else:
-                    # BLOCKED!
-                    protocol_blocked = True
-                    blocked_party_trigger = party
-                    blocked_counts[party] += 1
-                
-                trace.append(step_data)
-                
-                # NOTE: We DO NOT break here anymore. 
-                # We finish the batch to count all blocked attempts.
-            
-            response = {
-                'trace': trace,
-                'stats': active_protocol.get_stats(),
-                'blocked': protocol_blocked,
-                'blocked_party': blocked_party_trigger,
-                'blocked_counts': blocked_counts  # Send cumulative counts
-            }
+                        response = self.run_batch(session, data, trace_format)
+                finally:
+                    sessions.save(session)
+            sessions.touch()
+            if mode in ('ndjson', 'sse'):
+                return
+            if trace_format == 'binary':
+                try:
+                    self.write_binary(body, summary)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                return
+
+        else:
+            self.send_error(404)
+            return
 
+        body = json.dumps(response).encode('utf-8')
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self.wfile.write(body)
+
+    def run_batch(self, session, data, trace_format='json'):
+        outcome = {'blocked': False, 'blocked_party': None}
+        steps = iter_steps(session, build_schedule(data, session.next_rng()), outcome, **sampling(data))
+        if trace_format == 'packed':
+            response = {'trace_packed': base64.b64encode(encode_trace(steps)).decode('ascii')}
+        else:
+            response = {'trace': list(steps)}
+        response.update(batch_summary(session, outcome))
+        return response
+
+    def binary_batch(self, session, data):
+        # Raw packed trace as the body; the summary travels in a header
+        outcome = {'blocked': False, 'blocked_party': None}
+        body = encode_trace(iter_steps(session, build_schedule(data, session.next_rng()), outcome, **sampling(data)))
+        return body, batch_summary(session, outcome)
+
+    def write_binary(self, body, summary):
+        self.send_response(200)
+        self.send_header('Content-type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Batch-Summary', json.dumps(summary))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_batch(self, session, data, mode):
+        """
+        Writes step records as they are produced (chunked NDJSON or SSE).
+        If the client disconnects, the rest of the batch is still applied, just not sent.
+        """
+        outcome = {'blocked': False, 'blocked_party': None}
+        steps = iter_steps(session, build_schedule(data, session.next_rng()), outcome, **sampling(data))
+
+        def encode(record):
+            line = json.dumps(record)
+            return f"data: {line}\n\n" if mode == 'sse' else line + "\n"
+
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream' if mode == 'sse' else 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            buffer = []
+            for step_data in steps:
+                step_data['type'] = 'step'
+                buffer.append(encode(step_data))
+                if len(buffer) >= STREAM_FLUSH_STEPS:
+                    self.wfile.write(http_chunk(''.join(buffer)))
+                    buffer = []
+
+            summary = batch_summary(session, outcome)
+            summary['type'] = 'done'
+            buffer.append(encode(summary))
+            self.wfile.write(http_chunk(''.join(buffer)))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            for _ in steps:
+                pass
+
+
+def http_chunk(text):
+    data = text.encode('utf-8')
+    return f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n"
+
+
+def build_schedule(data, rng=random):
+    # Get inputs
+    a_count = int(data.get('a', 0))
+    b_count = int(data.get('b', 0))
+    c_count = int(data.get('c', 0))
+    shuffle_mode = data.get('shuffle', False)
+    
+    # Create batch schedule
+    schedule = []
+    schedule.extend(['A'] * a_count)
+    schedule.extend(['B'] * b_count)
+    schedule.extend(['C'] * c_count)
+    
+    if shuffle_mode:
+        rng.shuffle(schedule)
+    return schedule
+
+def sampling(data):
+    # Server-side downsampling: every k-th step and/or only swaps and blocks
+    return {
+        'every': max(1, int(data.get('every', 1))),
+        'events_only': bool(data.get('events_only', False)),
+    }
+
+def iter_steps(session, schedule, outcome, every=1, events_only=False):
+    """
+    Runs 'schedule' on the session's protocol, yielding one record per kept step.
+    Blocks are recorded in 'outcome' and the session's cumulative counts.
+    """
+    protocol = session.protocol
+    blocked_counts = session.blocked_counts
+    attempts = session.attempts
+    
+    for index, party in enumerate(schedule):
+        step_data = {
+            'party': party,
+            'success': False,
+            'pad': None,
+            'state': None,
+            'left_p': protocol.left_party,
+            'mid_p': protocol.middle_party,
+            'right_p': protocol.right_party
+        }
+        
+        attempts.append(ord(party))
+        pad = protocol.try_send(party)
+        if pad is not None:
+            step_data['success'] = True
+            step_data['pad'] = pad
+            # Serialize state for UI
+            if party == protocol.middle_party:
+                step_data['state'] = [
+                    protocol.middle_left_boundary[party],
+                    protocol.middle_right_boundary[party]
+                ]
+            else:
+                step_data['state'] = protocol.last_used[party]
+        else:
+            # BLOCKED!
+            outcome['blocked'] = True
+            outcome['blocked_party'] = party
+            blocked_counts[party] += 1
+        
+        step_data['swap'] = step_data['left_p'] != protocol.left_party or step_data['right_p'] != protocol.right_party
+        if pad is not None:
+            session.record(PARTY_CODES[party], pad, step_data['swap'])
+        
+        # NOTE: We DO NOT break here anymore. 
+        # We finish the batch to count all blocked attempts.
+        if events_only:
+            if step_data['success'] and not step_data['swap']: continue
+        elif index % every != every - 1 and index != len(schedule) - 1:
+            continue
+        yield step_data
+
+def delta(session, since, limit):
+    """Pads (base64 uint32 LE + party letters) and swaps after version 'since'."""
+    # One copy of the swaps taken after the count, so version, roles and boundaries
+    # all describe the same state; a swap still being recorded shows up next time
+    count = len(session.journal_parties)
+    swaps = [s for s in session.swaps[:] if s['index'] <= count]
+    start = min(session.journal_index(since, swaps), count)
+    end = min(count, start + max(1, limit))
+
+    pads = session.journal_pads[start:end]
+    if sys.byteorder != 'little':
+        pads.byteswap()
+    version = session.journal_version(end, swaps)
+    roles, bounds = session.view(end, swaps)
+    return {
+        'version': version,
+        'more': end < count,
+        'pads': base64.b64encode(pads.tobytes()).decode('ascii'),
+        'parties': ''.join('ABC'[c] for c in session.journal_parties[start:end]),
+        'swaps': [s for s in swaps if since < s['version'] <= version],
+        'roles': {'left_p': roles[0], 'mid_p': roles[1], 'right_p': roles[2]},
+        'boundaries': {'left': bounds[0], 'mid': bounds[1:3], 'right': bounds[3]},
+    }
+
+def batch_summary(session, outcome):
+    return {
+        'stats': session.protocol.get_stats(),
+        'version': session.protocol.version,  # A client that got every step is synced to this
+        'blocked': outcome['blocked'],
+        'blocked_party': outcome['blocked_party'],
+        'blocked_counts': session.blocked_counts  # Send cumulative counts
+    }
+
+def metrics_text():
+    lines = render_protocol(sessions.metrics())
+    lines += [
+        "# HELP otp_sessions_active Live protocol sessions.",
+        "# TYPE otp_sessions_active gauge",
+        f"otp_sessions_active {len(sessions)}",
+        "# HELP otp_sessions_memory_bytes Estimated memory held by live sessions.",
+        "# TYPE otp_sessions_memory_bytes gauge",
+        f"otp_sessions_memory_bytes {sessions.memory_bytes()}",
+        "# HELP otp_request_duration_seconds POST request latency by endpoint.",
+        "# TYPE otp_request_duration_seconds histogram",
+    ]
+    for path, histogram in REQUEST_LATENCY.items():
+        lines += histogram.render('otp_request_duration_seconds', f'path="{path}"')
+    return "\n".join(lines) + "\n"
+
+class ProtocolServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Many visualizer tabs may connect at once
 
 if __name__ == '__main__':
-    print("Starting server on http://localhost:8000...")
-    HTTPServer(('localhost', 8000), ProtocolHandler).serve_forever()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Protocol visualizer server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--session-ttl', type=int, default=1800, help="idle seconds before a session expires")
+    parser.add_argument('--max-sessions', type=int, default=100)
+    parser.add_argument('--max-memory-mb', type=int, default=256, help="estimated memory cap for all sessions")
+    parser.add_argument('--metrics-timing', action='store_true', help="time protocol methods for /metrics (adds overhead)")
+    parser.add_argument('--state-dir', default=None, help="persist sessions here and reload them on start")
+    args = parser.parse_args()
+
+    sessions = SessionStore(args.session_ttl, args.max_sessions, args.max_memory_mb * 1024 * 1024,
+                            args.metrics_timing, args.state_dir)
+    if args.state_dir:
+        print(f"Restored {len(sessions)} session(s) from {args.state_dir}")
+    print(f"Starting server on http://{args.host}:{args.port}...")
+    ProtocolServer((args.host, args.port), ProtocolHandler).serve_forever()
\ No newline at end of file
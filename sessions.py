@@ -0,0 +1,370 @@
+"""
+sessions.py - Per-client protocol sessions for server.py
+Bounded by count, idle time (TTL) and an estimated memory cap; least recently used go first.
+With a state directory, every session is saved as one file plus an append log of the
+runs since, and reloaded on restart.
+Every session has a seed and records each send attempt, so /log can hand out a replay.py log.
+"""
+import json
+import os
+import random
+import secrets
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from metrics import ProtocolMetrics
+from protocol import ThreePartyProtocol
+from replay import encode_log
+
+# Rough fixed cost of a session besides its pad ledger (dicts, lock, counters)
+SESSION_OVERHEAD_BYTES = 4096
+
+# Session file: header | protocol snapshot | JSON (blocked counts, swaps, seed, runs) | journal pads (uint32)
+# | journal parties | attempted parties (letters, to the end)
+SESSION_MAGIC = b'OTPX'
+SESSION_VERSION = 3
+SESSION_HEADER = struct.Struct('<4sB3xIII')  # magic, version, snapshot bytes, JSON bytes, journal entries
+SESSION_SUFFIX = '.session'
+
+# Append log next to a session file: one record per save since the file was last written
+# (header | snapshot | JSON (blocked counts, runs, new swaps) | new journal pads | new journal
+# parties | new attempts). Replayed and compacted into the file on load; a torn tail is dropped.
+LOG_SUFFIX = '.log'
+LOG_MAGIC = b'OTPA'
+# magic, CRC-32 of the body, journal entries and attempts before the record,
+# snapshot bytes, JSON bytes, new journal entries, new attempts
+LOG_RECORD = struct.Struct('<4sIIIIIII')
+
+
+class Session:
+    def __init__(self, session_id, n, d, metrics=None, seed=None):
+        self.id = session_id
+        self.seed = secrets.randbits(64) if seed is None else seed
+        self.runs = 0
+        self.protocol = ThreePartyProtocol(n, d, metrics=metrics)
+        self.blocked_counts = {'A': 0, 'B': 0, 'C': 0}
+        # Held for the whole of a request touching this session
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+        self.discarded = False  # Evicted/expired: never written to the state directory again
+        # (journal entries, swaps, attempts) in the state directory, None before the first save
+        self.saved = None
+        self.file_size = 0  # Bytes of the session file and of its append log
+        self.log_size = 0
+
+        # Append-only journal of consumed pads (for /delta). Readers may skip the lock:
+        # entries are only ever appended, pads before parties.
+        self.journal_pads = array('I')
+        self.journal_parties = bytearray()
+        self.swaps = []  # {'version', 'index', 'left_p', 'mid_p', 'right_p', 'bounds'}
+        self._view_memo = None  # (journal index, roles, bounds) last derived by view()
+        self.attempts = bytearray()  # Party letter of every send attempt, blocked ones included
+
+    def next_rng(self):
+        # One generator per /run derived from the seed, so nothing but a counter is persisted
+        rng = random.Random(f"{self.seed}:{self.runs}")
+        self.runs += 1
+        return rng
+
+    def log_bytes(self):
+        """Every attempt so far as a replay.py schedule log."""
+        return encode_log(self.seed, self.protocol.n, self.protocol.d, self.attempts.decode('ascii'))
+
+    def record(self, party_code, pad, swapped):
+        self.journal_pads.append(pad)
+        self.journal_parties.append(party_code)
+        if swapped:
+            p = self.protocol
+            middle = p.middle_party
+            self.swaps.append({'version': p.version, 'index': len(self.journal_parties),
+                               'left_p': p.left_party, 'mid_p': middle, 'right_p': p.right_party,
+                               'bounds': [p.last_used[p.left_party], p.middle_left_boundary[middle],
+                                          p.middle_right_boundary[middle], p.last_used[p.right_party]]})
+
+    @staticmethod
+    def journal_index(version, swaps):
+        # Pads consumed by 'version' (version = pads + swaps)
+        return version - sum(1 for s in swaps if s['version'] <= version)
+
+    @staticmethod
+    def journal_version(index, swaps):
+        return index + sum(1 for s in swaps if s['index'] <= index)
+
+    def view(self, index, swaps):
+        """
+        Roles and boundaries (left, middle left, middle right, right) after the first
+        'index' journal entries, derived from the journal alone so /delta needs no lock.
+        'swaps' is the caller's copy of self.swaps, covering at least those entries.
+        """
+        n = self.protocol.n
+        base, roles, bounds = 0, 'ACB', [0, n // 2, n // 2, n + 1]
+        for swap in swaps:
+            if swap['index'] > index:
+                break
+            base, roles, bounds = swap['index'], swap['left_p'] + swap['mid_p'] + swap['right_p'], swap['bounds']
+        memo = self._view_memo
+        if memo is not None and base < memo[0] <= index:
+            base, roles, bounds = memo
+        left, mid_lo, mid_hi, right = bounds
+        pads, parties = self.journal_pads, self.journal_parties
+        left_code, mid_code = 'ABC'.index(roles[0]), 'ABC'.index(roles[1])
+        for i in range(base, index):
+            party, pad = parties[i], pads[i]
+            if party == mid_code:
+                mid_lo, mid_hi = min(mid_lo, pad), max(mid_hi, pad)
+            elif party == left_code:
+                left = pad
+            else:
+                right = pad
+        bounds = [left, mid_lo, mid_hi, right]
+        self._view_memo = (index, roles, bounds)
+        return roles, bounds
+
+    def to_bytes(self):
+        snapshot = self.protocol.snapshot()
+        meta = json.dumps({'blocked_counts': self.blocked_counts, 'swaps': self.swaps,
+                           'seed': self.seed, 'runs': self.runs}).encode('utf-8')
+        count = len(self.journal_parties)
+        pads = self.journal_pads[:count]
+        if sys.byteorder != 'little':
+            pads.byteswap()
+        header = SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, len(snapshot), len(meta), count)
+        return b''.join([header, snapshot, meta, pads.tobytes(), bytes(self.journal_parties[:count]),
+                         bytes(self.attempts)])
+
+    def saved_counts(self):
+        return (len(self.journal_parties), len(self.swaps), len(self.attempts))
+
+    def log_record(self):
+        """Append log record with the current state and everything recorded since self.saved."""
+        entries, swaps, attempts = self.saved
+        snapshot = self.protocol.snapshot()
+        meta = json.dumps({'blocked_counts': self.blocked_counts, 'runs': self.runs,
+                           'swaps': self.swaps[swaps:]}).encode('utf-8')
+        count = len(self.journal_parties)
+        pads = self.journal_pads[entries:count]
+        if sys.byteorder != 'little':
+            pads.byteswap()
+        body = b''.join([snapshot, meta, pads.tobytes(), bytes(self.journal_parties[entries:count]),
+                         bytes(self.attempts[attempts:])])
+        header = LOG_RECORD.pack(LOG_MAGIC, zlib.crc32(body), entries, attempts, len(snapshot), len(meta),
+                                 count - entries, len(self.attempts) - attempts)
+        return header + body
+
+    def apply_log(self, data, metrics=None):
+        """
+        Replays append log records on top of this session. Records that do not continue
+        the current journal (left over from before the file was rewritten) are skipped.
+        Returns: number of records applied.
+        """
+        applied = 0
+        offset = 0
+        while offset + LOG_RECORD.size <= len(data):
+            magic, crc, entries, attempts, snapshot_len, meta_len, count, new_attempts = LOG_RECORD.unpack_from(data, offset)
+            start = offset + LOG_RECORD.size
+            end = start + snapshot_len + meta_len + 5 * count + new_attempts
+            body = data[start:end]
+            if magic != LOG_MAGIC or len(body) != end - start or zlib.crc32(body) != crc:
+                break  # Torn or corrupt tail
+            offset = end
+            meta = json.loads(body[snapshot_len:snapshot_len + meta_len].decode('utf-8'))
+            if (entries, attempts) != (len(self.journal_parties), len(self.attempts)) or meta['runs'] < self.runs:
+                continue
+
+            self.protocol = ThreePartyProtocol.restore(body[:snapshot_len], metrics=metrics)
+            self.blocked_counts = meta['blocked_counts']
+            self.runs = meta['runs']
+            self.swaps.extend(meta['swaps'])
+            pos = snapshot_len + meta_len
+            pads = array('I')
+            pads.frombytes(body[pos:pos + 4 * count])
+            if sys.byteorder != 'little':
+                pads.byteswap()
+            self.journal_pads.extend(pads)
+            self.journal_parties += body[pos + 4 * count:pos + 5 * count]
+            self.attempts += body[pos + 5 * count:]
+            applied += 1
+        return applied
+
+    @classmethod
+    def from_bytes(cls, session_id, data, metrics=None):
+        magic, version, snapshot_len, meta_len, count = SESSION_HEADER.unpack_from(data, 0)
+        if magic != SESSION_MAGIC or version != SESSION_VERSION:
+            raise ValueError("Not a session file")
+        offset = SESSION_HEADER.size
+        protocol = ThreePartyProtocol.restore(data[offset:offset + snapshot_len], metrics=metrics)
+        offset += snapshot_len
+        meta = json.loads(data[offset:offset + meta_len].decode('utf-8'))
+        offset += meta_len
+
+        session = cls(session_id, protocol.n, protocol.d, seed=meta['seed'])
+        session.runs = meta['runs']
+        session.protocol = protocol
+        session.blocked_counts = meta['blocked_counts']
+        session.swaps = meta['swaps']
+        session.journal_pads.frombytes(data[offset:offset + 4 * count])
+        if sys.byteorder != 'little':
+            session.journal_pads.byteswap()
+        session.journal_parties = bytearray(data[offset + 4 * count:offset + 5 * count])
+        session.attempts = bytearray(data[offset + 5 * count:])
+        return session
+
+    def memory_bytes(self):
+        journal = (self.journal_pads.buffer_info()[1] * self.journal_pads.itemsize
+                   + len(self.journal_parties) + len(self.attempts))
+        return SESSION_OVERHEAD_BYTES + sys.getsizeof(self.protocol) + self.protocol.used_pads.memory_bytes() + journal
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SessionStore:
+    def __init__(self, ttl=1800, max_sessions=100, max_bytes=256 * 1024 * 1024, timing=False, state_dir=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.timing = timing  # Per-method protocol timing (see metrics.py)
+        self.state_dir = state_dir
+        self._sessions = OrderedDict()  # LRU order: oldest first
+        self._lock = threading.Lock()
+        # Counters of evicted sessions, so aggregated totals never go down
+        self.retired = ProtocolMetrics(timing)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self._load()
+
+    def create(self, n, d, seed=None):
+        session = Session(secrets.token_hex(8), n, d, ProtocolMetrics(self.timing), seed)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict(keep=session.id)
+        self.save(session)
+        return session
+
+    def save(self, session):
+        """
+        Persists the session (call with session.lock held or before it is shared): appends
+        what changed since the last save to its log, or rewrites the file once the log
+        has outgrown it. Skipped for a session evicted meanwhile, so it cannot come back on restart.
+        """
+        if not self.state_dir or session.discarded: return
+        path = os.path.join(self.state_dir, session.id + SESSION_SUFFIX)
+        if session.saved is not None and session.log_size <= session.file_size:
+            record = session.log_record()
+            # Under the store lock: _discard() sets the flag and deletes the files under it too
+            with self._lock:
+                if session.discarded: return
+                with open(path + LOG_SUFFIX, 'ab') as f:
+                    f.write(record)
+            session.log_size += len(record)
+            session.saved = session.saved_counts()
+            return
+
+        data = session.to_bytes()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        with self._lock:
+            if session.discarded:
+                os.remove(path + '.tmp')
+                return
+            os.replace(path + '.tmp', path)
+            # A log left behind by a crash here is skipped on load: its records predate the file
+            remove_file(path + LOG_SUFFIX)
+        session.file_size = len(data)
+        session.log_size = 0
+        session.saved = session.saved_counts()
+
+    def _load(self):
+        # Oldest files first, so the LRU order survives a restart
+        paths = [os.path.join(self.state_dir, name) for name in os.listdir(self.state_dir) if name.endswith(SESSION_SUFFIX)]
+        for path in sorted(paths, key=os.path.getmtime):
+            session_id = os.path.basename(path)[:-len(SESSION_SUFFIX)]
+            metrics = ProtocolMetrics(self.timing)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                session = Session.from_bytes(session_id, data, metrics)
+                log = b''
+                if os.path.exists(path + LOG_SUFFIX):
+                    with open(path + LOG_SUFFIX, 'rb') as f:
+                        log = f.read()
+                    session.apply_log(log, metrics)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Skipping unreadable session file {path}: {e}", file=sys.stderr)
+                continue
+            self._sessions[session_id] = session
+            if log:
+                self.save(session)  # Compact: the file absorbs the log
+            else:
+                session.file_size = len(data)
+                session.saved = session.saved_counts()
+        # Logs without a session file belong to sessions discarded mid-save
+        known = {session_id + SESSION_SUFFIX + LOG_SUFFIX for session_id in self._sessions}
+        for name in os.listdir(self.state_dir):
+            if name.endswith(SESSION_SUFFIX + LOG_SUFFIX) and name not in known:
+                remove_file(os.path.join(self.state_dir, name))
+        self._evict()
+
+    def _discard(self, session_id):
+        session = self._sessions.pop(session_id)
+        session.discarded = True
+        self.retired.merge(session.protocol.metrics)
+        if self.state_dir:
+            path = os.path.join(self.state_dir, session_id + SESSION_SUFFIX)
+            remove_file(path)
+            remove_file(path + LOG_SUFFIX)
+        return session
+
+    def get(self, session_id):
+        """Session for session_id (marked as used), or None if unknown/expired."""
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def touch(self):
+        # Re-check limits after a session grew (e.g. after a /run)
+        with self._lock:
+            self._evict()
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(s.memory_bytes() for s in self._sessions.values())
+
+    def metrics(self):
+        """ProtocolMetrics summed over live and evicted sessions."""
+        total = ProtocolMetrics(self.timing)
+        with self._lock:
+            total.merge(self.retired)
+            for session in self._sessions.values():
+                total.merge(session.protocol.metrics)
+        return total
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, keep=None):
+        # Expired sessions first, then least recently used while over a limit
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_access > self.ttl]:
+            if session_id != keep:
+                self._discard(session_id)
+
+        total = sum(s.memory_bytes() for s in self._sessions.values())
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and total <= self.max_bytes:
+                break
+            if session_id == keep:
+                continue
+            total -= self._discard(session_id).memory_bytes()
@@ -2,8 +2,17 @@
 suite.py - Stratified Monte Carlo Simulation (Scenario Testing)
 Covers S.1, S.2, S.3 with specific sub-cases and global aggregation.
 """
+import argparse
+import functools
+import hashlib
+import json
+import os
 import random
 import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from analytic import single_party_wastage
 from protocol import ThreePartyProtocol
 
 # --- Configuration ---
@@ -28,35 +37,59 @@ TEST_CONFIGS = [
 ]
 
 ITERATIONS = 1000 
+CHUNK_SIZE = 100  # Iterations per parallel work unit
+MIN_CHUNKS = 2  # Adaptive mode: chunks run before the CI may stop a column
+CACHE_DIR = '.suite_cache'  # Per-unit results, one file per protocol source hash
 
-def run_simulation(n, d, active_subset):
+# Scenario columns: each iteration draws one active subset from the candidates
+SCENARIOS = [
+    ('S.1 End',  [['A'], ['B']]),       # End Party (A or B)
+    ('S.1 Mid',  [['C']]),              # Middle Party (C)
+    ('S.2 Ends', [['A', 'B']]),         # Ends only (A and B)
+    ('S.2 Mix',  [['A', 'C'], ['B', 'C']]),  # Mixed (Middle involved)
+    ('S.3 All',  [['A', 'B', 'C']]),    # All parties
+]
+
+def run_simulation(n, d, active_subset, rng=random, schedule=None):
     """
     Runs a simulation where ONLY 'active_subset' parties are allowed to talk.
+    rng: random.Random (or the random module) driving weights and picks.
+    schedule: optional list; every send attempt's party is appended (see replay.py).
     Returns: % Wastage
     """
     protocol = ThreePartyProtocol(n, d)
     
+    # Single talker: nothing is random, fast-forward until it blocks
+    if len(active_subset) == 1:
+        result = protocol.send_many(active_subset[0], n)
+        if schedule is not None:
+            # The attempts a stepped run makes: every send, then the one that blocked
+            schedule.extend(active_subset * (result['sent'] + (1 if result['blocked'] else 0)))
+        return (protocol.get_stats()['wasted'] / n) * 100.0
+    
     # Randomize "Personality" (Weights) for the ACTIVE subset
-    weights = [random.random() for _ in active_subset]
+    weights = [rng.random() for _ in active_subset]
     total_w = sum(weights)
     norm_weights = [w/total_w for w in weights]
     
     while True:
         # Pick one party from the ACTIVE list
-        party = random.choices(active_subset, weights=norm_weights, k=1)[0]
+        party = rng.choices(active_subset, weights=norm_weights, k=1)[0]
+        if schedule is not None:
+            schedule.append(party)
         
         # Try to send
-        if protocol.can_send(party):
-            protocol.send_message(party)
-        else:
+        if protocol.try_send(party) is None:
             # If blocked, check if OTHER active parties can move
             others = [p for p in active_subset if protocol.can_send(p)]
             if not others:
                 break # Deadlock among active parties
             
             # Force move from another active party
-            alt = random.choice(others)
-            protocol.send_message(alt)
+            alt = rng.choice(others)
+            if schedule is not None:
+                schedule.append(alt)
+            protocol.try_send(alt)
             
         if len(protocol.used_pads) == n:
             break
@@ -64,8 +97,238 @@ def run_simulation(n, d, active_subset):
     stats = protocol.get_stats()
     return (stats['wasted'] / n) * 100.0
 
+@functools.lru_cache(maxsize=None)
+def deterministic_wastage(n, d, party):
+    # One talker never touches the RNG's outcome, so each (n, d, party) runs once per process.
+    # The closed form (analytic.py) covers most configs in O(1); the rest are simulated.
+    value = single_party_wastage(n, d, party)
+    if value is None:
+        value = run_simulation(n, d, [party])
+    return value
+
+def is_deterministic(candidates):
+    """True if every run's outcome depends only on which candidate subset was drawn."""
+    return all(len(subset) == 1 for subset in candidates)
+
+def run_scenario(n, d, candidates, iterations, backend='scalar', rng=random):
+    """
+    Runs one scenario column 'iterations' times.
+    Returns: list of % Wastage (one per run)
+    """
+    subsets = [rng.choice(candidates) for _ in range(iterations)]
+    if is_deterministic(candidates):
+        return [deterministic_wastage(n, d, subset[0]) for subset in subsets]
+    if backend == 'numpy':
+        import numpy as np
+        from batch import run_batch_simulation, masks_for
+        np_rng = np.random.default_rng(rng.getrandbits(64))
+        return run_batch_simulation(n, d, masks_for(subsets), np_rng).tolist()
+    return [run_simulation(n, d, subset, rng) for subset in subsets]
+
+def unit_seed(master_seed, n, d, scenario, chunk):
+    """Seed for one work unit. Depends only on the unit, never on the worker."""
+    return f"{master_seed}:{n}:{d}:{scenario}:{chunk}"
+
+def run_unit(unit):
+    """
+    Worker entry point for one (config, scenario, iteration-chunk) work unit.
+    Returns: (values, CPU seconds spent)
+    """
+    n, d, scenario, chunk, iterations, backend, master_seed = unit
+    start = time.process_time()
+    rng = random.Random(unit_seed(master_seed, n, d, scenario, chunk))
+    candidates = dict(SCENARIOS)[scenario]
+    values = run_scenario(n, d, candidates, iterations, backend, rng)
+    return values, time.process_time() - start
+
+def source_hash(backend):
+    """
+    Hash of the code a result depends on; any change starts a fresh cache file.
+    All of suite.py is included (scenarios, seed derivation, work units), not just the simulation.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    files = ['suite.py', 'protocol.py', 'ledger.py', 'analytic.py'] + (['batch.py'] if backend == 'numpy' else [])
+    digest = hashlib.sha256()
+    for name in files:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+class ResultCache:
+    """On-disk per-unit results keyed by (n, d, scenario, seed, chunk), one JSON file per source hash."""
+    def __init__(self, directory, code_hash):
+        self.path = os.path.join(directory, f"{code_hash}.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(unit):
+        return ':'.join(str(field) for field in unit)
+
+    def get(self, unit):
+        return self.entries.get(self.key(unit))
+
+    def put(self, unit, values):
+        self.entries[self.key(unit)] = values
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+def make_unit(n, d, scenario, chunk, backend, master_seed):
+    iterations = min(CHUNK_SIZE, ITERATIONS - chunk * CHUNK_SIZE)
+    return (n, d, scenario, chunk, iterations, backend, master_seed)
+
+class RunningStats:
+    """
+    Mergeable count/mean/variance/min/max (Welford, chunks combined with Chan's update).
+    The sum is kept exact so 'mean' matches statistics.mean over the same values.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = Fraction(0)
+        self.m2 = 0.0
+        self._mean = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    @property
+    def mean(self):
+        return float(self.total / self.count) if self.count else 0.0
+
+    def add(self, values):
+        chunk = RunningStats()
+        for x in values:
+            chunk.count += 1
+            delta = x - chunk._mean
+            chunk._mean += delta / chunk.count
+            chunk.m2 += delta * (x - chunk._mean)
+        if values:
+            chunk.total = sum(map(Fraction, values), Fraction(0))
+            chunk.min = min(values)
+            chunk.max = max(values)
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other._mean - self._mean
+        self._mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self):
+        return {'count': self.count, 'total': str(self.total), 'mean': self._mean,
+                'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data['count']
+        stats.total = Fraction(data['total'])
+        stats._mean = data['mean']
+        stats.m2 = data['m2']
+        stats.min = data['min']
+        stats.max = data['max']
+        return stats
+
+    def half_width(self, z):
+        """Normal-approximation CI half-width of the mean."""
+        if self.count < 2:
+            return float('inf')
+        return z * (self.m2 / (self.count - 1) / self.count) ** 0.5
+
+class UnitRunner:
+    """Runs work units through the cache and (optionally) a process pool, in order."""
+    def __init__(self, executor, cache):
+        self.executor = executor
+        self.cache = cache
+        self.cpu_time = 0.0
+        self.total = 0
+        self.cached = 0
+
+    def run(self, units):
+        found = [self.cache.get(unit) if self.cache else None for unit in units]
+        pending = [unit for unit, values in zip(units, found) if values is None]
+        outputs = self.executor.map(run_unit, pending) if self.executor else map(run_unit, pending)
+        results = []
+        for unit, values in zip(units, found):
+            if values is None:
+                values, elapsed = next(outputs)
+                self.cpu_time += elapsed
+                if self.cache:
+                    self.cache.put(unit, values)
+            results.append(values)
+        self.total += len(units)
+        self.cached += len(units) - len(pending)
+        return results
+
+def run_config(n, d, runner, backend, master_seed, ci_target=None, z=1.96, round_chunks=1):
+    """
+    Runs every scenario column of one config.
+    With ci_target, a column stops after the first chunk (from MIN_CHUNKS on) where its
+    CI half-width is <= ci_target; up to 'round_chunks' chunks per column are run per round.
+    Chunks past the stopping point are discarded, so results never depend on round_chunks.
+    Returns: {scenario: RunningStats}
+    """
+    max_chunks = -(-ITERATIONS // CHUNK_SIZE)
+    if ci_target is None:
+        round_chunks = max_chunks
+    stats = {scenario: RunningStats() for scenario, _ in SCENARIOS}
+    next_chunk = {scenario: 0 for scenario, _ in SCENARIOS}
+    active = [scenario for scenario, _ in SCENARIOS]
+    
+    while active:
+        units = []
+        for scenario in active:
+            for chunk in range(next_chunk[scenario], min(max_chunks, next_chunk[scenario] + round_chunks)):
+                units.append(make_unit(n, d, scenario, chunk, backend, master_seed))
+        for unit, values in zip(units, runner.run(units)):
+            scenario = unit[2]
+            if scenario not in active:
+                continue  # Already converged earlier in this round
+            stats[scenario].add(values)
+            next_chunk[scenario] += 1
+            converged = (ci_target is not None and next_chunk[scenario] >= MIN_CHUNKS
+                         and stats[scenario].half_width(z) <= ci_target)
+            if converged or next_chunk[scenario] == max_chunks:
+                active.remove(scenario)
+    return stats
+
 def main():
-    print(f"\n3-PARTY PROTOCOL TESTING SUITE (N={len(TEST_CONFIGS)}, Iterations={ITERATIONS}/scenario)")
+    parser = argparse.ArgumentParser(description="3-Party Protocol Testing Suite")
+    parser.add_argument('--backend', choices=['scalar', 'numpy'], default='scalar',
+                        help="scalar: ThreePartyProtocol per run, numpy: batch.py lockstep engine")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes (0 = all cores)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="master seed; results are identical for any --workers")
+    parser.add_argument('--cache-dir', default=CACHE_DIR,
+                        help="reuse per-unit results of earlier seeded runs of unchanged code")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--ci-target', type=float, default=None,
+                        help="stop a column once its CI half-width is below this many percentage points (e.g. 0.25)")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    args = parser.parse_args()
+    backend = args.backend
+    workers = args.workers or os.cpu_count()
+    master_seed = args.seed if args.seed is not None else random.randrange(2**32)
+    z = statistics.NormalDist().inv_cdf(0.5 + args.confidence / 2)
+
+    print(f"\n3-PARTY PROTOCOL TESTING SUITE (N={len(TEST_CONFIGS)}, Iterations={ITERATIONS}/scenario, Backend={backend})")
+    print(f"Master Seed: {master_seed}  Workers: {workers}")
+    if args.ci_target is not None:
+        print(f"Adaptive: stop at {args.confidence:.0%} CI half-width <= {args.ci_target} pp "
+              f"(checked every {CHUNK_SIZE} iterations, at least {MIN_CHUNKS * CHUNK_SIZE})")
     
     # Define Header Columns
     header_cols = (
@@ -89,61 +352,35 @@ def main():
     print(header_cols)
     print("-" * len(header_cols))
     
+    # Only seeded sweeps are cached (an unseeded run can never be asked for again)
+    cache = None
+    if args.seed is not None and not args.no_cache:
+        cache = ResultCache(args.cache_dir, source_hash(backend))
+    
+    wall_start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    runner = UnitRunner(executor, cache)
+    # Adaptive rounds: enough chunks per column to keep every worker busy
+    round_chunks = max(1, -(-workers // len(SCENARIOS)))
+    total_runs = 0
+    
     for config in TEST_CONFIGS:
         n = config['n']
         d = config['d']
         
-        # Storage for results
-        res_s1_end = []
-        res_s1_mid = []
-        res_s2_ends = []
-        res_s2_mix = []
-        res_s3 = []
-        
-        # Master list for global stats (combines all scenarios)
-        all_runs_for_config = []
-        
-        for _ in range(ITERATIONS):
-            # --- S.1 Scenarios ---
-            # Case A: End Party (A or B)
-            party_s1_end = random.choice([['A'], ['B']])
-            val = run_simulation(n, d, party_s1_end)
-            res_s1_end.append(val)
-            all_runs_for_config.append(val)
-            
-            # Case B: Middle Party (C)
-            val = run_simulation(n, d, ['C'])
-            res_s1_mid.append(val)
-            all_runs_for_config.append(val)
-            
-            # --- S.2 Scenarios ---
-            # Case A: Ends only (A and B)
-            val = run_simulation(n, d, ['A', 'B'])
-            res_s2_ends.append(val)
-            all_runs_for_config.append(val)
-            
-            # Case B: Mixed (Middle involved) -> (A,C) or (B,C)
-            party_s2_mix = random.choice([['A', 'C'], ['B', 'C']])
-            val = run_simulation(n, d, party_s2_mix)
-            res_s2_mix.append(val)
-            all_runs_for_config.append(val)
-            
-            # --- S.3 Scenario ---
-            val = run_simulation(n, d, ['A', 'B', 'C'])
-            res_s3.append(val)
-            all_runs_for_config.append(val)
-            
-        # Calculate Scenario Averages
-        avg_s1_end = statistics.mean(res_s1_end)
-        avg_s1_mid = statistics.mean(res_s1_mid)
-        avg_s2_ends = statistics.mean(res_s2_ends)
-        avg_s2_mix = statistics.mean(res_s2_mix)
-        avg_s3 = statistics.mean(res_s3)
+        stats = run_config(n, d, runner, backend, master_seed, args.ci_target, z, round_chunks)
+        columns = [stats[scenario] for scenario, _ in SCENARIOS]
+        avg_s1_end, avg_s1_mid, avg_s2_ends, avg_s2_mix, avg_s3 = [s.mean for s in columns]
         
-        # Calculate Global Extremes and Average across ALL collected runs
-        global_best = min(all_runs_for_config)
-        global_worst = max(all_runs_for_config)
-        global_avg = statistics.mean(all_runs_for_config)
+        # Global Extremes across ALL collected runs (S.1 + S.2 + S.3); the average weighs
+        # every scenario equally, as adaptive columns stop after different run counts
+        combined = RunningStats()
+        for column in columns:
+            combined.merge(column)
+        global_best = combined.min
+        global_worst = combined.max
+        global_avg = sum(s.mean for s in columns) / len(columns)
+        total_runs += combined.count
         
         # Print Row
         print(
@@ -153,7 +390,32 @@ def main():
             f"{avg_s3:<9.2f} | "
             f"{global_best:<7.2f} {global_worst:<7.2f} {global_avg:<7.2f}"
         )
+        if args.ci_target is not None:
+            # CI half-width (pp) and iterations used under each figure
+            ci = [f"±{s.half_width(z):.2f}" for s in columns]
+            runs = [f"n={s.count}" for s in columns]
+            print(
+                f"{'':<5} {'':<4} | "
+                f"{ci[0]:<9} {ci[1]:<9} | {ci[2]:<9} {ci[3]:<9} | {ci[4]:<9} |\n"
+                f"{'':<5} {'':<4} | "
+                f"{runs[0]:<9} {runs[1]:<9} | {runs[2]:<9} {runs[3]:<9} | {runs[4]:<9} | {combined.count} runs"
+            )
 
+    if executor:
+        executor.shutdown()
+    if cache:
+        cache.save()
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = runner.cpu_time
+    
+    print("-" * len(header_cols))
+    # Speedup = serial-equivalent CPU time / elapsed wall time
+    print(f"Wall Time: {wall_time:.1f}s  CPU Time: {cpu_time:.1f}s  Speedup: {cpu_time / wall_time:.2f}x ({workers} workers)")
+    if args.ci_target is not None:
+        full = len(TEST_CONFIGS) * len(SCENARIOS) * ITERATIONS
+        print(f"Iterations Used: {total_runs}/{full} ({total_runs / full:.0%})")
+    if cache:
+        print(f"Cached Units: {runner.cached}/{runner.total} ({cache.path})")
     print("-" * len(header_cols))
     print("Legend:")
     print("  S.1 End  : Only A or Only B talks (C is static)")
@@ -161,12 +423,14 @@ def main():
     print("  S.2 Ends : A and B talk (C is static)")
     print("  S.2 Mix  : One End (A/B) and Middle (C) talk")
     print("  S.3 All  : All parties active")
+    if args.ci_target is not None:
+        print("  ±x / n=k : CI half-width (percentage points) / iterations run for the figure above")
     print("-" * len(header_cols))
     print("Global Stats:")
     print("  * Best % : The lowest wastage % found in ANY simulated scenario for this {N,d}.")
     print("  * Worst %: The highest wastage % found in ANY simulated scenario for this {N,d}.")
-    print("  * Avg %  : The mean wastage across ALL 5,000 simulations combined (S.1 + S.2 + S.3).")
+    print("  * Avg %  : The mean of the five scenario averages (S.1 + S.2 + S.3, equally weighted).")
     print("  * Static Limit  : 66.7% (The wastage if we just split N into 3 fixed parts and only 1 talked)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,237 @@
+"""
+sweep.py - Resumable (n, d) parameter sweeps over the suite.py scenarios.
+Per-run wastage is appended to runs.csv; index.jsonl records each finished work unit
+(CSV end offset + running stats). A crashed sweep resumes from the last indexed unit.
+
+Run: python sweep.py --n 1e3:1e7*10 --d 1%,5%,10% --seed 42 --out sweeps/prod
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from suite import SCENARIOS, CHUNK_SIZE, RunningStats, run_unit, source_hash
+
+# Pad-steps per work unit; bounds the work lost to a crash at large n
+CHUNK_PADS = 10**6
+
+CSV_HEADER = "n,d,scenario,run,wastage\n"
+
+
+def parse_values(spec, n=None):
+    """
+    Comma-separated items, each one of:
+      1000          a single value (1e6 style allowed)
+      100:1000:100  inclusive linear range
+      1e3:1e7*10    inclusive geometric range
+      5%            percent of n (d specs only)
+    """
+    values = []
+    for item in spec.split(','):
+        item = item.strip()
+        if item.endswith('%'):
+            if n is None:
+                raise ValueError(f"'{item}': percentages are only allowed for d")
+            values.append(max(1, round(n * float(item[:-1]) / 100)))
+        elif ':' in item:
+            start, rest = item.split(':', 1)
+            start = float(start)
+            if '*' in rest:
+                stop, factor = (float(x) for x in rest.split('*'))
+                if factor <= 1:
+                    raise ValueError(f"'{item}': factor must be > 1")
+                value = start
+                while value <= stop * (1 + 1e-9):
+                    values.append(round(value))
+                    value *= factor
+            else:
+                stop, step = (float(x) for x in rest.split(':'))
+                count = int((stop - start) / step + 1e-9)
+                values.extend(round(start + i * step) for i in range(count + 1))
+        else:
+            values.append(round(float(item)))
+    return sorted(set(values))
+
+
+def make_cells(n_spec, d_spec, max_ratio):
+    """(n, d) grid points with d <= max_ratio * n. Returns (cells, skipped)."""
+    cells = []
+    skipped = 0
+    for n in parse_values(n_spec):
+        for d in parse_values(d_spec, n):
+            if 1 <= d <= n * max_ratio:
+                cells.append((n, d))
+            else:
+                skipped += 1
+    return cells, skipped
+
+
+def chunk_size(n):
+    return max(1, min(CHUNK_SIZE, CHUNK_PADS // n))
+
+
+def make_units(n, d, iterations, backend, master_seed):
+    size = chunk_size(n)
+    units = []
+    for scenario, _ in SCENARIOS:
+        for chunk, start in enumerate(range(0, iterations, size)):
+            units.append((n, d, scenario, chunk, min(size, iterations - start), backend, master_seed))
+    return units
+
+
+class SweepStore:
+    """
+    Output directory of one sweep:
+      meta.json    settings the results depend on (checked on resume)
+      runs.csv     n,d,scenario,run,wastage - one line per simulation
+      index.jsonl  one line per finished unit: key, CSV end offset, RunningStats
+      summary.csv  per-cell aggregates (rewritten at the end)
+    Rows are flushed before their index line, so anything past the last indexed
+    offset is a torn write and is cut off on open.
+    """
+    def __init__(self, directory, meta):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                existing = json.load(f)
+            if existing != meta:
+                raise ValueError(f"{directory} holds a sweep with different settings: {existing}")
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+
+        self.done = {}
+        csv_end = 0
+        index_path = os.path.join(directory, 'index.jsonl')
+        index_end = 0
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line
+                    index_end += len(line)
+                    self.done[tuple(entry['unit'])] = RunningStats.from_dict(entry['stats'])
+                    csv_end = max(csv_end, entry['end'])
+
+        self.index = open(index_path, 'ab')
+        self.index.truncate(index_end)
+        self.runs = open(os.path.join(directory, 'runs.csv'), 'ab')
+        self.runs.truncate(csv_end)
+        if csv_end == 0:
+            self.runs.write(CSV_HEADER.encode('ascii'))
+
+    @staticmethod
+    def key(unit):
+        n, d, scenario, chunk = unit[:4]
+        return (n, d, scenario, chunk)
+
+    def get(self, unit):
+        return self.done.get(self.key(unit))
+
+    def put(self, unit, values):
+        n, d, scenario, chunk, _, _, _ = unit
+        first = chunk * chunk_size(n)
+        rows = ''.join(f"{n},{d},{scenario},{first + i},{v!r}\n" for i, v in enumerate(values))
+        self.runs.write(rows.encode('ascii'))
+        self.runs.flush()
+        os.fsync(self.runs.fileno())
+
+        stats = RunningStats()
+        stats.add(values)
+        entry = {'unit': list(self.key(unit)), 'end': self.runs.tell(), 'stats': stats.to_dict()}
+        self.index.write((json.dumps(entry) + "\n").encode('ascii'))
+        self.index.flush()
+        self.done[self.key(unit)] = stats
+        return stats
+
+    def write_summary(self, rows):
+        path = os.path.join(self.directory, 'summary.csv')
+        with open(path + '.tmp', 'w') as f:
+            f.write("n,d," + ','.join(f"{s} mean,{s} ci95,{s} runs" for s, _ in SCENARIOS) + ",best,worst,avg\n")
+            for n, d, columns, combined in rows:
+                cells = [f"{c.mean!r},{c.half_width(1.96)!r},{c.count}" for c in columns]
+                f.write(f"{n},{d},{','.join(cells)},{combined.min!r},{combined.max!r},{combined.mean!r}\n")
+        os.replace(path + '.tmp', path)
+
+    def close(self):
+        self.runs.close()
+        self.index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable (n, d) parameter sweep")
+    parser.add_argument('--n', required=True, help="n values, e.g. 1000,5000 or 1e3:1e7*10 or 100:1000:100")
+    parser.add_argument('--d', required=True, help="d values, same forms plus percent of n (e.g. 1%%,5%%)")
+    parser.add_argument('--max-ratio', type=float, default=0.1, help="skip cells with d > ratio * n")
+    parser.add_argument('--iterations', type=int, default=100, help="runs per scenario per cell")
+    parser.add_argument('--backend', choices=['scalar', 'numpy'], default='scalar')
+    parser.add_argument('--workers', type=int, default=1, help="worker processes (0 = all cores)")
+    parser.add_argument('--seed', type=int, default=None, help="master seed (default: random, or the seed of the sweep in --out)")
+    parser.add_argument('--out', required=True, help="output directory; re-running resumes it")
+    args = parser.parse_args()
+
+    cells, skipped = make_cells(args.n, args.d, args.max_ratio)
+    master_seed = args.seed
+    meta_path = os.path.join(args.out, 'meta.json')
+    if master_seed is None and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            master_seed = json.load(f)['seed']  # Resuming: keep the sweep's seed
+    if master_seed is None:
+        master_seed = random.randrange(2**32)
+    workers = args.workers or os.cpu_count()
+    meta = {'seed': master_seed, 'iterations': args.iterations, 'backend': args.backend,
+            'chunk_pads': CHUNK_PADS, 'code': source_hash(args.backend)}
+    try:
+        store = SweepStore(args.out, meta)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    all_units = [make_units(n, d, args.iterations, args.backend, master_seed) for n, d in cells]
+    pending = [unit for units in all_units for unit in units if store.get(unit) is None]
+    total = sum(len(units) for units in all_units)
+    print(f"Sweep: {len(cells)} cells ({skipped} skipped), {total} units, "
+          f"{total - len(pending)} already done, seed {master_seed}, {workers} workers -> {args.out}")
+
+    header = f"{'N':<9} {'d':<7} | " + ' '.join(f"{s:<9}" for s, _ in SCENARIOS) + f" | {'Best %':<7} {'Worst %':<7} {'Avg %':<7}"
+    print(header)
+    print("-" * len(header))
+
+    wall_start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and pending else None
+    outputs = executor.map(run_unit, pending) if executor else map(run_unit, pending)
+    summary = []
+    try:
+        for (n, d), units in zip(cells, all_units):
+            by_scenario = {scenario: RunningStats() for scenario, _ in SCENARIOS}
+            for unit in units:
+                stats = store.get(unit)
+                if stats is None:
+                    values, _ = next(outputs)
+                    stats = store.put(unit, values)
+                by_scenario[unit[2]].merge(stats)
+            columns = [by_scenario[scenario] for scenario, _ in SCENARIOS]
+            combined = RunningStats()
+            for column in columns:
+                combined.merge(column)
+            summary.append((n, d, columns, combined))
+            print(f"{n:<9} {d:<7} | " + ' '.join(f"{c.mean:<9.2f}" for c in columns)
+                  + f" | {combined.min:<7.2f} {combined.max:<7.2f} {combined.mean:<7.2f}")
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        store.close()
+
+    store.write_summary(summary)
+    print("-" * len(header))
+    print(f"Wall Time: {time.perf_counter() - wall_start:.1f}s  Results: {os.path.join(args.out, 'runs.csv')}, summary.csv")
+
+
+if __name__ == "__main__":
+    main()
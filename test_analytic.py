@@ -0,0 +1,33 @@
+"""
+test_analytic.py - The closed-form single-talker wastage against the protocol itself.
+Run: python -m pytest test_analytic.py
+"""
+from analytic import single_party_wasted
+from protocol import ThreePartyProtocol
+
+
+def stepped_wasted(n, d, party):
+    # One try_send at a time until blocked (run_simulation would take the send_many path)
+    protocol = ThreePartyProtocol(n, d)
+    while protocol.try_send(party) is not None:
+        pass
+    return n - len(protocol.used_pads)
+
+
+def test_closed_form_matches_try_send_loop():
+    compared = 0
+    for n in range(1, 161):
+        for d in range(n):
+            for party in 'ABC':
+                expected = single_party_wasted(n, d, party)
+                if expected is None:
+                    continue
+                assert stepped_wasted(n, d, party) == expected, (n, d, party)
+                compared += 1
+    assert compared > 10000
+
+
+def test_closed_form_matches_at_larger_n():
+    for n, d in [(1000, 3), (1001, 10), (4099, 57), (10000, 100), (12345, 999)]:
+        for party in 'ABC':
+            assert stepped_wasted(n, d, party) == single_party_wasted(n, d, party), (n, d, party)
@@ -0,0 +1,65 @@
+"""
+test_codec.py - Packed /run traces: encode/decode round trip and the layout index.html decodes.
+Run: python -m pytest test_codec.py
+"""
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import pytest
+from codec import HEADER, ROLE_PERMS, decode_trace, encode_trace
+from server import iter_steps
+from sessions import Session
+
+INDEX_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
+
+
+def trace_steps():
+    # Sends, swaps and blocked attempts from a real session
+    session = Session('codec', 200, 3, seed=8)
+    outcome = {'blocked': False, 'blocked_party': None}
+    steps = list(iter_steps(session, 'A' * 120 + 'CBCBAC' * 20, outcome))
+    assert any(s['swap'] for s in steps) and not all(s['success'] for s in steps)
+    return [{k: v for k, v in step.items() if k != 'state'} for step in steps]
+
+
+def index_html_source(name):
+    with open(INDEX_HTML, encoding='utf-8') as f:
+        html = f.read()
+    if name == 'ROLE_PERMS':
+        return re.search(r"const ROLE_PERMS = (\[.*?\]);", html).group(1)
+    return re.search(r"(    function %s\(.*?\n    \}\n)" % name, html, re.S).group(1)
+
+
+def test_round_trip():
+    steps = trace_steps()
+    assert decode_trace(encode_trace(steps)) == steps
+    assert decode_trace(encode_trace([])) == []
+    with pytest.raises(ValueError):
+        decode_trace(b'XXXX' + encode_trace(steps)[4:])
+
+
+def test_layout_matches_index_html():
+    # decodeTrace: count at byte 8, pads from byte 12, then parties, flags and perm ids
+    steps = trace_steps()
+    data = encode_trace(steps)
+    count = len(steps)
+    assert HEADER.size == 12 and struct.unpack_from('<I', data, 8)[0] == count
+    assert len(data) == 12 + 7 * count
+    pads = struct.unpack_from(f'<{count}I', data, 12)
+    assert [p if s['success'] else None for p, s in zip(pads, steps)] == [s['pad'] for s in steps]
+    assert [ROLE_PERMS[b] for b in data[12 + 6 * count:]] == [s['left_p'] + s['mid_p'] + s['right_p'] for s in steps]
+    assert json.loads(index_html_source('ROLE_PERMS').replace("'", '"')) == ROLE_PERMS
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="needs node")
+def test_index_html_decodes_encoded_trace():
+    steps = trace_steps()
+    script = (f"const ROLE_PERMS = {index_html_source('ROLE_PERMS')};\n{index_html_source('decodeTrace')}\n"
+              f"const bytes = Buffer.from('{encode_trace(steps).hex()}', 'hex');\n"
+              "const buffer = bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length);\n"
+              "console.log(JSON.stringify(decodeTrace(buffer)));")
+    output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+    assert json.loads(output) == steps
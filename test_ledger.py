@@ -0,0 +1,57 @@
+"""
+test_ledger.py - IntervalLedger against the original set-based behavior (SetLedger).
+Run: python -m pytest test_ledger.py
+"""
+import random
+import pytest
+from ledger import IntervalLedger, SetLedger
+from protocol import ThreePartyProtocol
+
+SCHEDULES = 3000
+
+
+def state(protocol):
+    return (protocol.left_party, protocol.middle_party, protocol.right_party,
+            dict(protocol.last_used), dict(protocol.middle_left_boundary),
+            dict(protocol.middle_right_boundary), dict(protocol.has_sent), dict(protocol.messages_sent))
+
+
+def assert_same_ledger(a, b, n, rng):
+    assert len(a) == len(b)
+    assert a.intervals() == b.intervals()
+    for pos in [0, 1, n, n + 1] + [rng.randint(1, n) for _ in range(5)]:
+        assert (pos in a) == (pos in b)
+        assert a.free_gap(pos) == b.free_gap(pos)
+
+
+def test_random_operations():
+    rng = random.Random(1)
+    for _ in range(200):
+        n = rng.randint(1, 300)
+        interval, pads = IntervalLedger(n), SetLedger(n)
+        for _ in range(rng.randint(0, 40)):
+            lo = rng.randint(1, n)
+            hi = min(n, lo + rng.choice([0, 0, 1, 5, 30]))
+            interval.add_range(lo, hi)
+            pads.add_range(lo, hi)
+            assert_same_ledger(interval, pads, n, rng)
+        assert list(interval) == list(pads)
+        assert_same_ledger(interval.copy(), pads.copy(), n, rng)
+
+
+@pytest.mark.parametrize('chunk', range(3))
+def test_protocol_schedules(chunk):
+    # SCHEDULES random runs in all; every send and block must match the set-based ledger
+    rng = random.Random(chunk)
+    for _ in range(SCHEDULES // 3):
+        n = rng.randint(3, 400)
+        d = rng.randint(0, max(0, n // 4))
+        a = ThreePartyProtocol(n, d, IntervalLedger)
+        b = ThreePartyProtocol(n, d, SetLedger)
+        active = rng.choice(['A', 'B', 'C', 'AB', 'AC', 'BC', 'ABC'])
+        for _ in range(rng.randint(1, 2 * n)):
+            party = rng.choice(active)
+            assert a.try_send(party) == b.try_send(party)
+            assert state(a) == state(b)
+        assert_same_ledger(a.used_pads, b.used_pads, n, rng)
+        assert a.get_stats() == b.get_stats()
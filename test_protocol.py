@@ -0,0 +1,54 @@
+"""
+test_protocol.py - ThreePartyProtocol fast paths against the one-step reference.
+Run: python -m pytest test_protocol.py
+"""
+import random
+from protocol import ThreePartyProtocol
+
+
+def random_state(rng):
+    # A protocol advanced by a random prefix schedule of one to three talkers
+    n = rng.randrange(20, 3000)
+    protocol = ThreePartyProtocol(n, rng.randrange(0, max(1, n // 12)))
+    talkers = rng.sample('ABC', rng.randrange(1, 4))
+    for _ in range(rng.randrange(0, n)):
+        protocol.try_send(rng.choice(talkers))
+    return protocol
+
+
+def expand(ranges):
+    return sorted(pad for lo, hi in ranges for pad in range(lo, hi + 1))
+
+
+def test_send_many_matches_try_send():
+    rng = random.Random(4)
+    for _ in range(400):
+        base = random_state(rng)
+        party = rng.choice('ABC')
+        k = rng.randrange(1, base.n + 10)
+        bulk, stepped = base.fork(), base.fork()
+
+        result = bulk.send_many(party, k)
+        pads = [stepped.try_send(party) for _ in range(k)]
+        used = [pad for pad in pads if pad is not None]
+
+        assert result['sent'] == len(used)
+        assert result['blocked'] == k - len(used)
+        assert sum(hi - lo + 1 for lo, hi in result['ranges']) == result['sent']
+        assert expand(result['ranges']) == sorted(used)
+        assert bulk.version == stepped.version
+        assert bulk.snapshot() == stepped.snapshot()
+
+
+def test_block_reason_agrees_with_check_safety():
+    rng = random.Random(17)
+    reasons = set()
+    for _ in range(300):
+        protocol = random_state(rng)
+        positions = [rng.randrange(-1, protocol.n + 3) for _ in range(20)]
+        for party in 'ABC':
+            for position in positions + [protocol.get_next_position(party)]:
+                reason = protocol.block_reason(party, position)
+                assert protocol.check_safety(party, position) == (reason is None), (party, position, reason)
+                reasons.add(reason)
+    assert reasons == {None, 'out_of_range', 'buffer_middle', 'buffer_left', 'buffer_right', 'reused'}
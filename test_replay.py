@@ -0,0 +1,95 @@
+"""
+test_replay.py - Schedule log encoding and differential replay.
+Run: python -m pytest test_replay.py
+"""
+import random
+import sys
+import types
+import pytest
+from ledger import SetLedger
+from protocol import ThreePartyProtocol
+from replay import Implementation, decode_logs, diff, encode_log, record_simulation, replay
+
+
+class LegacyProtocol:
+    """Shaped like the original class: Class(n, d), send_message only, used_pads a set."""
+    def __init__(self, n, d):
+        self._protocol = ThreePartyProtocol(n, d, SetLedger)
+
+    def send_message(self, party):
+        return self._protocol.try_send(party)
+
+    @property
+    def used_pads(self):
+        return set(self._protocol.used_pads)
+
+    def __getattr__(self, name):
+        if name in ('try_send', 'send_many'):
+            raise AttributeError(name)
+        return getattr(self._protocol, name)
+
+
+class OffByOne(ThreePartyProtocol):
+    def apply_send(self, party, pad):
+        swapped = super().apply_send(party, pad)
+        if self.version == 300 and party == self.middle_party:
+            self.middle_right_boundary[party] -= 1
+        return swapped
+
+
+@pytest.fixture(autouse=True)
+def test_module():
+    module = types.ModuleType('replay_test_impls')
+    module.LegacyProtocol = LegacyProtocol
+    module.OffByOne = OffByOne
+    sys.modules[module.__name__] = module
+    yield
+    del sys.modules[module.__name__]
+
+
+def test_log_round_trip():
+    rng = random.Random(1)
+    for length in range(0, 20):
+        schedule = ''.join(rng.choice('ABC') for _ in range(length))
+        data = encode_log(7, 100, 5, schedule) + encode_log(8, 50, 2, schedule[::-1])
+        assert list(decode_logs(data)) == [(7, 100, 5, schedule), (8, 50, 2, schedule[::-1])]
+    with pytest.raises(ValueError):
+        list(decode_logs(encode_log(1, 10, 1, 'ABCAB')[:-1]))
+
+
+def test_replay_matches_recording():
+    wastage, log = record_simulation(2000, 10, ['A', 'C'], 3)
+    [(seed, n, d, schedule)] = list(decode_logs(log))
+    for spec in ('protocol:ThreePartyProtocol', 'protocol:ThreePartyProtocol,set,step',
+                 'replay_test_impls:LegacyProtocol'):
+        stats = replay(n, d, schedule, Implementation(spec))
+        assert stats['wasted'] / n * 100.0 == wastage
+
+
+@pytest.mark.parametrize('party', 'ABC')
+def test_single_talker_records_attempts_until_blocked(party):
+    # Every send, then the one blocked attempt: what a try_send loop would have made
+    _, log = record_simulation(1000, 10, [party], 0)
+    [(_, n, d, schedule)] = list(decode_logs(log))
+    stats = replay(n, d, schedule, Implementation('protocol:ThreePartyProtocol,step'))
+    assert stats['blocked'] == 1
+    assert len(schedule) == stats['used'] + 1
+
+
+@pytest.mark.parametrize('active', [['A', 'B', 'C'], ['A', 'C'], ['C']])
+def test_legacy_class_agrees(active):
+    legacy = Implementation('replay_test_impls:LegacyProtocol')
+    assert not legacy.bulk
+    for seed in range(3):
+        _, log = record_simulation(1500, 8, active, seed)
+        [(_, n, d, schedule)] = list(decode_logs(log))
+        assert diff(n, d, schedule, legacy, Implementation('protocol:ThreePartyProtocol')) is None
+
+
+def test_first_divergence_reported():
+    _, log = record_simulation(2000, 10, ['A', 'C'], 3)
+    [(_, n, d, schedule)] = list(decode_logs(log))
+    result = diff(n, d, schedule, Implementation('replay_test_impls:LegacyProtocol'),
+                  Implementation('replay_test_impls:OffByOne'))
+    assert result is not None and result['step'] is not None
+    assert result['a']['middle'] != result['b']['middle']
@@ -0,0 +1,118 @@
+"""
+test_sessions.py - Session persistence (file + append log) in the state directory,
+and the journal view behind /delta.
+Run: python -m pytest test_sessions.py
+"""
+import os
+import random
+from server import iter_steps
+from sessions import LOG_SUFFIX, Session, SessionStore, SESSION_SUFFIX
+
+
+def files(state_dir):
+    return sorted(name[:-len(SESSION_SUFFIX)] for name in os.listdir(state_dir) if name.endswith(SESSION_SUFFIX))
+
+
+def test_restart_restores_sessions(tmp_path):
+    store = SessionStore(state_dir=str(tmp_path))
+    session = store.create(200, 5, seed=7)
+    for party in 'AACBCA':
+        session.attempts.append(ord(party))
+        session.protocol.try_send(party)
+    store.save(session)
+
+    restored = SessionStore(state_dir=str(tmp_path)).get(session.id)
+    assert restored.protocol.snapshot() == session.protocol.snapshot()
+    assert restored.log_bytes() == session.log_bytes()
+
+
+def run(store, session, schedule):
+    outcome = {'blocked': False, 'blocked_party': None}
+    session.next_rng()
+    for _ in iter_steps(session, schedule, outcome):
+        pass
+    store.save(session)
+
+
+def state(session):
+    return (session.protocol.snapshot(), session.log_bytes(), session.swaps, session.runs,
+            session.blocked_counts, session.journal_pads.tobytes(), bytes(session.journal_parties))
+
+
+def test_runs_are_appended_and_compacted_on_load(tmp_path):
+    store = SessionStore(state_dir=str(tmp_path))
+    session = store.create(300, 3, seed=5)
+    log_path = tmp_path / (session.id + SESSION_SUFFIX + LOG_SUFFIX)
+    rng = random.Random(1)
+    appended = 0
+    for schedule in ['A' * 160] + [rng.choice('ABC') * rng.randrange(1, 8) for _ in range(11)]:
+        run(store, session, schedule)
+        appended += log_path.exists()
+        restored = SessionStore(state_dir=str(tmp_path)).get(session.id)
+        assert state(restored) == state(session)
+        # Loading compacted the log into the file, and the session carries on from there
+        assert not log_path.exists()
+        store, session = SessionStore(state_dir=str(tmp_path)), restored
+        store._sessions[session.id] = session
+    assert appended and session.swaps
+
+
+def test_torn_and_stale_log_records_are_skipped(tmp_path):
+    store = SessionStore(state_dir=str(tmp_path))
+    session = store.create(3000, 3, seed=5)
+    run(store, session, 'ABC' * 300)
+    # Reloading writes a file large enough for the next runs to be appended
+    store = SessionStore(state_dir=str(tmp_path))
+    session = store.get(session.id)
+    run(store, session, 'AACB')
+    log_path = tmp_path / (session.id + SESSION_SUFFIX + LOG_SUFFIX)
+    log = log_path.read_bytes()
+    expected = state(session)
+    run(store, session, 'CCCA')
+    assert log_path.read_bytes().startswith(log)
+
+    # A crash mid-append leaves a torn last record
+    log_path.write_bytes(log_path.read_bytes()[:-3])
+    assert state(SessionStore(state_dir=str(tmp_path)).get(session.id)) == expected
+
+    # A crash between rewriting the file and deleting the log leaves records the file already has
+    log_path.write_bytes(log)
+    assert state(SessionStore(state_dir=str(tmp_path)).get(session.id)) == expected
+
+
+def test_evicted_session_is_not_saved_again(tmp_path):
+    store = SessionStore(max_sessions=1, state_dir=str(tmp_path))
+    evicted = store.create(100, 5)
+    # A /run holding evicted.lock finishes after a newer session pushed it out
+    kept = store.create(100, 5)
+    assert files(tmp_path) == [kept.id]
+    evicted.protocol.try_send('A')
+    store.save(evicted)
+    assert files(tmp_path) == [kept.id]
+    assert sorted(os.listdir(tmp_path)) == [kept.id + SESSION_SUFFIX]
+
+    restarted = SessionStore(max_sessions=1, state_dir=str(tmp_path))
+    assert restarted.get(evicted.id) is None
+    assert restarted.get(kept.id) is not None
+
+
+def test_journal_view_matches_protocol():
+    # /delta takes roles and boundaries from the journal, never from the live protocol
+    rng = random.Random(3)
+    session = Session('view', 3000, 3, seed=1)
+    protocol = session.protocol
+    for _ in range(200):
+        talkers = rng.sample('ABC', rng.randrange(1, 4))
+        for party in [rng.choice(talkers) for _ in range(rng.randrange(1, 60))]:
+            left, right = protocol.left_party, protocol.right_party
+            pad = protocol.try_send(party)
+            if pad is None:
+                continue
+            swapped = left != protocol.left_party or right != protocol.right_party
+            session.record('ABC'.index(party), pad, swapped)
+            middle = protocol.middle_party
+            expected = (protocol.left_party + middle + protocol.right_party,
+                        [protocol.last_used[protocol.left_party], protocol.middle_left_boundary[middle],
+                         protocol.middle_right_boundary[middle], protocol.last_used[protocol.right_party]])
+            assert session.view(len(session.journal_parties), session.swaps[:]) == expected
+    assert session.swaps
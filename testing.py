@@ -1,11 +1,30 @@
 """
 Enhanced Testing Program (Terminal)
 Uses the Single Source of Truth protocol.py
+
+Interactive: python testing.py [--n 100 --d 5 --seed 1]
+Headless:    python testing.py --input schedule.txt (or '-' for stdin) [--print-steps]
+Input is party letters (A/B/C) or role codes (L/M/R, resolved against the roles
+when their run starts), optionally with a count: "AAAB C500 M20, L3".
+Each input line is one batch (shuffled with --shuffle, like interactive mode).
 """
+import argparse
 import random
+import re
 import sys
+import time
 from protocol import ThreePartyProtocol
 
+# One run: a letter with a count, or the same letter repeated
+TOKEN = re.compile(r'([ABCLMR])(?:(\d+)|\1*)')
+SEPARATORS = re.compile(r'[\s,]*')
+
+# Runs at least this long go through send_many when steps are not printed
+BULK_MIN_RUN = 8
+
+# Buffered output lines per write
+OUTPUT_FLUSH_LINES = 4096
+
 def get_party_state_str(protocol, party):
     if not protocol.has_sent[party]:
         if party == protocol.middle_party:
@@ -36,9 +55,7 @@ def print_final_statistics(protocol, attempts, blocked):
     print(f"Wastage: {stats['wasted']} pads")
     print(f"{'='*90}\n")
 
-def run_interactive_mode():
-    n = 100
-    d = 5
+def run_interactive_mode(n=100, d=5, rng=random):
     protocol = ThreePartyProtocol(n, d)
     
     print(f"\nINTERACTIVE TEST MODE: n={n}, d={d}")
@@ -74,7 +91,7 @@ def run_interactive_mode():
                     schedule.extend([protocol.right_party] * r)
                     
                     # Randomized by default
-                    random.shuffle(schedule)
+                    rng.shuffle(schedule)
                     print(f"Batch: {len(schedule)} messages (Asynchronous/Randomized)")
                     
                 except ValueError:
@@ -89,15 +106,10 @@ def run_interactive_mode():
             for party in schedule:
                 attempts_count[party] += 1
                 
-                if protocol.can_send(party):
-                    pad = protocol.send_message(party)
-                    if pad:
-                        step += 1
-                        a = get_party_state_str(protocol, 'A')
-                        b = get_party_state_str(protocol, 'B')
-                        c = get_party_state_str(protocol, 'C')
-                        conf = f"{protocol.left_party}-{protocol.middle_party}-{protocol.right_party}"
-                        print(f"{step:<6} {party:<6} {pad:<6} A:{a:<10} B:{b:<10} C:{c:<10} {conf}")
+                pad = protocol.try_send(party)
+                if pad is not None:
+                    step += 1
+                    print(step_line(protocol, step, party, pad))
                 else:
                     blocked_count[party] += 1
                     print(f"⚠ Party {party} BLOCKED")
@@ -112,5 +124,124 @@ def run_interactive_mode():
             
     print_final_statistics(protocol, attempts_count, blocked_count)
 
+def step_line(protocol, step, party, pad):
+    a = get_party_state_str(protocol, 'A')
+    b = get_party_state_str(protocol, 'B')
+    c = get_party_state_str(protocol, 'C')
+    conf = f"{protocol.left_party}-{protocol.middle_party}-{protocol.right_party}"
+    return f"{step:<6} {party:<6} {pad:<6} A:{a:<10} B:{b:<10} C:{c:<10} {conf}"
+
+def parse_runs(line, line_number):
+    """(letter, count) per run in one input line."""
+    runs = []
+    pos = 0
+    line = line.upper().rstrip()
+    while True:
+        pos = SEPARATORS.match(line, pos).end()
+        if pos == len(line):
+            return runs
+        match = TOKEN.match(line, pos)
+        if match is None:
+            raise ValueError(f"line {line_number}: unexpected {line[pos:pos + 10]!r}")
+        runs.append((match.group(1), int(match.group(2)) if match.group(2) else match.end() - pos))
+        pos = match.end()
+
+def resolve(protocol, letter):
+    if letter == 'L': return protocol.left_party
+    if letter == 'M': return protocol.middle_party
+    if letter == 'R': return protocol.right_party
+    return letter
+
+def run_batch_mode(stream, n, d, rng=random, shuffle=False, print_steps=False, stop_on_block=False, out=sys.stdout):
+    """
+    Streams batches from 'stream' (one per line) through a fresh protocol.
+    Returns: (protocol, attempts per party, blocked per party, seconds)
+    """
+    protocol = ThreePartyProtocol(n, d)
+    attempts_count = {'A': 0, 'B': 0, 'C': 0}
+    blocked_count = {'A': 0, 'B': 0, 'C': 0}
+    buffer = []
+    step = 0
+    start = time.perf_counter()
+
+    def attempt(party):
+        nonlocal step
+        attempts_count[party] += 1
+        pad = protocol.try_send(party)
+        if pad is None:
+            blocked_count[party] += 1
+            if print_steps:
+                buffer.append(f"⚠ Party {party} BLOCKED")
+        else:
+            step += 1
+            if print_steps:
+                buffer.append(step_line(protocol, step, party, pad))
+        if len(buffer) >= OUTPUT_FLUSH_LINES:
+            out.write("\n".join(buffer) + "\n")
+            buffer.clear()
+        return pad
+
+    for line_number, line in enumerate(stream, 1):
+        runs = parse_runs(line, line_number)
+        batch_blocked = False
+        if shuffle:
+            # Like interactive batches: roles resolved up front, then randomized
+            schedule = [p for letter, count in runs for p in resolve(protocol, letter) * count]
+            rng.shuffle(schedule)
+            for party in schedule:
+                if attempt(party) is None:
+                    batch_blocked = True
+        else:
+            for letter, count in runs:
+                party = resolve(protocol, letter)
+                if print_steps or count < BULK_MIN_RUN:
+                    for _ in range(count):
+                        if attempt(party) is None:
+                            batch_blocked = True
+                    continue
+                result = protocol.send_many(party, count)
+                attempts_count[party] += count
+                blocked_count[party] += result['blocked']
+                step += result['sent']
+                batch_blocked = batch_blocked or result['blocked'] > 0
+        if batch_blocked and stop_on_block:
+            buffer.append("\n*** DEADLOCK DETECTED - ENDING SIMULATION ***")
+            break
+
+    if buffer:
+        out.write("\n".join(buffer) + "\n")
+    return protocol, attempts_count, blocked_count, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Terminal tester for protocol.py")
+    parser.add_argument('--n', type=int, default=100)
+    parser.add_argument('--d', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=None, help="seed for batch shuffles")
+    parser.add_argument('--input', default=None, help="schedule file ('-' for stdin); runs headless")
+    parser.add_argument('--shuffle', action='store_true', help="headless: shuffle each input line")
+    parser.add_argument('--print-steps', action='store_true', help="headless: print every step")
+    parser.add_argument('--stop-on-block', action='store_true', help="headless: stop after the first batch with a block")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.input is None:
+        run_interactive_mode(args.n, args.d, rng)
+        return
+
+    stream = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        protocol, attempts, blocked, elapsed = run_batch_mode(
+            stream, args.n, args.d, rng, args.shuffle, args.print_steps, args.stop_on_block)
+    except ValueError as e:
+        sys.exit(f"Invalid schedule: {e}")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print_final_statistics(protocol, attempts, blocked)
+    total = sum(attempts.values())
+    rate = total / elapsed if elapsed else 0.0
+    print(f"Throughput: {total} attempts in {elapsed:.3f}s ({rate / 1e6:.2f}M attempts/s)")
+
 if __name__ == "__main__":
-    run_interactive_mode()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+worstcase.py - Exact worst-case wastage over adversarial schedules.
+The adversary picks which active party sends next until no active party can
+move (as run_simulation does); the search finds the schedule that wastes the most.
+Depth-first branch-and-bound over forked protocol states, with a bounded
+transposition table keyed by role-canonical states.
+
+Run: python worstcase.py --n 40 --d 2 [--active ABC] [--samples 1000]
+"""
+import argparse
+import random
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from protocol import ThreePartyProtocol
+
+EXACT = 0
+UPPER = 1  # Stored value is an upper bound (search was cut off at alpha)
+
+
+def canonical_key(protocol, active):
+    """
+    Hashable key of everything the future depends on, by role rather than party name
+    (party names, has_sent and counters never change what can happen next).
+    """
+    left, middle, right = protocol.left_party, protocol.middle_party, protocol.right_party
+    roles = (left in active) | (middle in active) << 1 | (right in active) << 2
+    key = array('q', (roles, protocol.last_used[left], protocol.last_used[right],
+                      protocol.middle_left_boundary[middle], protocol.middle_right_boundary[middle]))
+    for lo, hi in protocol.used_pads.intervals():
+        key.append(lo)
+        key.append(hi)
+    return key.tobytes()  # Packed: several times smaller than a tuple key
+
+
+class WorstCaseSearch:
+    def __init__(self, n, d, active='ABC', table_size=1000000):
+        self.n = n
+        self.d = d
+        self.active = list(active)
+        self.table_size = table_size
+        self.table = OrderedDict()  # key -> (value, EXACT/UPPER), LRU order
+        self.nodes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * n + 1000))
+
+    def _moves(self, protocol):
+        # Active parties that can send, in role order (left, middle, right)
+        roles = (protocol.left_party, protocol.middle_party, protocol.right_party)
+        return [p for p in roles if p in self.active and protocol.can_send(p)]
+
+    def _store(self, key, value, flag):
+        table = self.table
+        table[key] = (value, flag)
+        table.move_to_end(key)
+        if len(table) > self.table_size:
+            table.popitem(last=False)
+
+    def value(self, protocol, alpha=-1):
+        """
+        Worst final wastage reachable from 'protocol' if it exceeds alpha;
+        otherwise some upper bound <= alpha.
+        """
+        self.nodes += 1
+        key = canonical_key(protocol, self.active)
+        entry = self.table.get(key)
+        if entry is not None:
+            stored, flag = entry
+            if flag == EXACT or stored <= alpha:
+                self.hits += 1
+                self.table.move_to_end(key)
+                return stored
+
+        wasted = self.n - len(protocol.used_pads)
+        moves = self._moves(protocol)
+        if not moves:
+            self._store(key, wasted, EXACT)
+            return wasted
+
+        # Bound: at least one more pad will be used
+        if wasted - 1 <= alpha:
+            self.cutoffs += 1
+            return wasted - 1
+
+        best = -1
+        for party in moves:
+            child = protocol.fork()
+            child.try_send(party)
+            best = max(best, self.value(child, max(alpha, best)))
+            if best == wasted - 1:
+                break  # Cannot do better than blocking right after this send
+        self._store(key, best, EXACT if best > alpha else UPPER)
+        return best
+
+    def solve(self, protocol=None):
+        """Returns (worst wastage, schedule reaching it) from 'protocol' (default: fresh state)."""
+        root = protocol if protocol is not None else ThreePartyProtocol(self.n, self.d)
+        worst = self.value(root)
+
+        # Walk down children whose value matches (mostly table hits)
+        schedule = []
+        state = root
+        while True:
+            moves = self._moves(state)
+            if not moves:
+                break
+            for party in moves:
+                child = state.fork()
+                child.try_send(party)
+                if self.value(child, worst - 1) == worst:
+                    schedule.append(party)
+                    state = child
+                    break
+            else:
+                raise RuntimeError("Lost the worst-case path")
+        return worst, schedule
+
+
+def sampled_worst(n, d, active, samples, seed):
+    """Worst wastage (pads) over 'samples' random run_simulation-style schedules, for comparison."""
+    rng = random.Random(seed)
+    worst = 0
+    for _ in range(samples):
+        protocol = ThreePartyProtocol(n, d)
+        weights = [rng.random() for _ in active]
+        while True:
+            party = rng.choices(active, weights=weights, k=1)[0]
+            if protocol.try_send(party) is None:
+                others = [p for p in active if protocol.can_send(p)]
+                if not others:
+                    break
+                protocol.try_send(rng.choice(others))
+        worst = max(worst, n - len(protocol.used_pads))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact worst-case wastage search")
+    parser.add_argument('--n', type=int, default=40)
+    parser.add_argument('--d', type=int, default=2)
+    parser.add_argument('--active', default='ABC', help="parties the adversary may schedule")
+    parser.add_argument('--table-size', type=int, default=1000000, help="transposition table entries (~250 bytes each)")
+    parser.add_argument('--samples', type=int, default=0, help="also report the worst of this many random schedules")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    active = args.active.upper()
+    search = WorstCaseSearch(args.n, args.d, active, args.table_size)
+    start = time.perf_counter()
+    worst, schedule = search.solve()
+    elapsed = time.perf_counter() - start
+
+    print(f"Worst-case search: n={args.n}, d={args.d}, active={active}")
+    print(f"  Worst wastage : {worst}/{args.n} pads ({worst / args.n * 100:.2f}%)")
+    print(f"  Schedule      : {''.join(schedule)} ({len(schedule)} sends)")
+    print(f"  Search        : {search.nodes} nodes, {search.hits} table hits, {search.cutoffs} cutoffs, "
+          f"{len(search.table)} entries, {elapsed:.2f}s")
+    if args.samples:
+        sampled = sampled_worst(args.n, args.d, list(active), args.samples, args.seed)
+        print(f"  Monte Carlo   : worst of {args.samples} random schedules = {sampled}/{args.n} pads "
+              f"({sampled / args.n * 100:.2f}%)")
+
+
+if __name__ == "__main__":
+    main()